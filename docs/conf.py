@@ -12,6 +12,8 @@ author = u"RRAP"
 
 # -- General configuration ---------------------------------------------------
 
+import os
+
 # Add any Sphinx extension module names here, as strings. They can be
 # extensions coming with Sphinx (named 'sphinx.ext.*') or your custom
 # ones.
@@ -19,9 +21,19 @@ extensions = [
     "myst_nb",
     "autoapi.extension",
     "sphinx.ext.napoleon",
-    "sphinx.ext.viewcode",
 ]
+
+# Highlighted source pages are slow to generate - skip them for quick local
+# builds with FAST_DOCS=1
+if os.environ.get("FAST_DOCS") != "1":
+    extensions.append("sphinx.ext.viewcode")
+
 autoapi_dirs = ["../src"]
+# Keep the generated rst between builds so unchanged API pages are not
+# re-read by Sphinx on every incremental build
+autoapi_keep_files = True
+# The API index is already listed in the index.md toctree
+autoapi_add_toctree_entry = False
 
 # List of patterns, relative to source directory, that match files and
 # directories to ignore when looking for source files.
@@ -40,22 +52,42 @@ autodoc_default_options = {
     'special-members': '__init__',
 }
 
-# Temporary workaround for 5.1.0 bug
-import sphinx
-if sphinx.__version__ == '5.1.0':
-    # see https://github.com/sphinx-doc/sphinx/issues/10701
-    # hope is it would get fixed for the next release
-
-    # Although crash happens within NumpyDocstring, it is subclass of GoogleDocstring
-    # so we need to overload method there
-    from sphinx.ext.napoleon.docstring import GoogleDocstring
-    from functools import wraps
-
-    @wraps(GoogleDocstring._consume_inline_attribute)
-    def _consume_inline_attribute_safe(self):
-        try:
-            return self._consume_inline_attribute_safe()
-        except:
-            return "", []
-
-    GoogleDocstring._consume_inline_attribute = _consume_inline_attribute_safe
+
+# -- AutoAPI incremental builds ----------------------------------------------
+
+# AutoAPI rewrites every generated rst file on each build, which bumps the
+# mtimes and makes Sphinx treat the whole API tree as outdated. Snapshot the
+# generated files before AutoAPI runs and put back the old mtime of any file
+# whose content did not change.
+
+_autoapi_snapshot = {}
+
+
+def _autoapi_root(app):
+    return os.path.join(app.srcdir, app.config.autoapi_root)
+
+
+def _snapshot_autoapi(app, config):
+    root = _autoapi_root(app)
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                _autoapi_snapshot[path] = (f.read(), os.stat(path).st_mtime_ns)
+
+
+def _restore_unchanged_mtimes(app):
+    for path, (content, mtime) in _autoapi_snapshot.items():
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            if f.read() == content:
+                os.utime(path, ns=(mtime, mtime))
+    _autoapi_snapshot.clear()
+
+
+def setup(app):
+    app.connect("config-inited", _snapshot_autoapi)
+    # AutoAPI generates its files in builder-inited at the default priority
+    # (500), so restore afterwards
+    app.connect("builder-inited", _restore_unchanged_mtimes, priority=900)
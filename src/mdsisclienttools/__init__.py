@@ -1,14 +1,13 @@
+import sys
+
 try:
-    # New format
-    # > Python3.7 ish
-    from importlib.metadata import version # type: ignore
+    if sys.version_info >= (3, 8):
+        # New format
+        from importlib.metadata import version
+    else:
+        # Older backport version
+        from importlib_metadata import version  # type: ignore
     __version__ = version("mdsisclienttools")
-except:
-    # Older format
-    # Older backport version
-    try:
-        from importlib_metadata import version # type: ignore
-        __version__ = version("mdsisclienttools")
-    except:
-        # Can't work out how to import version - set to Unknown
-        __version__ = "Unknown - import error"
+except Exception:
+    # Can't work out how to import version - set to Unknown
+    __version__ = "Unknown - import error"
@@ -1,12 +1,37 @@
-import webbrowser
+import threading
+import os
+import tempfile
+import sys
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-from jose import jwt  # type: ignore
-from jose.constants import ALGORITHMS  # type: ignore
-from pydantic import BaseModel
+import random
+import base64
+from pydantic import BaseModel, ValidationError
 from enum import Enum
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Tuple, Iterator, cast
+from contextlib import contextmanager
 import json
+import functools
+import hashlib
+from collections import OrderedDict
+from urllib.parse import urlencode, quote_plus
+
+try:
+    # orjson is an optional, faster JSON encoder/decoder
+    import orjson  # type: ignore
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        # Stage keys are str enums which orjson treats as non str keys
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    from json import loads as _json_loads  # type: ignore
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
 
 
 class StorageType(str, Enum):
@@ -19,9 +44,11 @@ class StorageType(str, Enum):
 class BearerAuth(requests.auth.AuthBase):
     def __init__(self, token: str):
         self.token = token
+        # built once rather than on every request
+        self._header = "Bearer " + token
 
     def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
-        r.headers["authorization"] = "Bearer " + self.token
+        r.headers["authorization"] = self._header
         return r
 
 
@@ -33,6 +60,9 @@ class Stage(str, Enum):
     PROD = "PROD"
 
 
+# Tokens built by this module from keycloak responses are created with
+# .construct() to skip validation - only data read back from storage is
+# validated
 class Tokens(BaseModel):
     access_token: str
     # refresh tokens are marked as optional because offline tokens should not be cached
@@ -42,16 +72,340 @@ class Tokens(BaseModel):
 class StageTokens(BaseModel):
     stages: Dict[Stage, Optional[Tokens]]
 
+    class Config:
+        # parse_file/parse_raw use orjson when it is installed
+        json_loads = _json_loads
+
 
 LOCAL_STORAGE_DEFAULT = ".tokens.json"
 DEFAULT_CLIENT_ID = "client-tools"
 
+# Device code lifespan (s) to assume if keycloak does not advertise one
+DEFAULT_DEVICE_CODE_LIFESPAN = 600
+
+# Up to this many seconds are added to each device flow poll interval so
+# that clients started together don't poll in lock step
+DEVICE_POLL_JITTER = 0.5
+
+# Access tokens with less than this many seconds of life remaining are
+# treated as expired so they are refreshed before being handed out. The
+# margin is capped at half the token's lifetime (see _stale_at) so that
+# realms issuing very short lived tokens still work.
+TOKEN_EXPIRY_MARGIN = 60
+
+# How long (s) a retrieved keycloak public key is reused before it is fetched
+# again. Realm keys rotate rarely so this saves a round trip per manager.
+PUBLIC_KEY_CACHE_TTL = 3600
+
+# With FILE storage, retrieved public keys are also kept in a file named
+# after the token storage file with this suffix so new processes can skip
+# the fetch while the key is within PUBLIC_KEY_CACHE_TTL
+PUBLIC_KEY_STORAGE_SUFFIX = ".pubkey.json"
+
+# keycloak endpoint -> (PEM public key, parsed key, time.monotonic() when
+# retrieved, conditional request headers to revalidate it with)
+_PUBLIC_KEY_CACHE: Dict[str, Tuple[str, Any, float, Dict[str, str]]] = {}
+
+# Number of verified access tokens remembered in _VALIDATED_TOKENS
+VALIDATED_TOKEN_CACHE_SIZE = 32
+
+# (keycloak endpoint, sha256 of verified access token) -> unix time after
+# which the token is treated as expired, i.e. exp less the expiry margin
+# (least recently used first). Shared by all managers so each token's
+# signature is only verified once against each realm's key. Hashes are kept
+# so the cache doesn't hold on to the tokens themselves.
+_VALIDATED_TOKENS: "OrderedDict[Tuple[str, bytes], float]" = OrderedDict()
+
+# Access tokens issued for less than this many seconds are replaced at half
+# life rather than TOKEN_EXPIRY_MARGIN before they expire
+SHORT_TOKEN_LIFETIME = 600
+
+# (token endpoint, client id, scopes, sha256 of offline token) -> (tokens
+# from exchanging the offline token, unix time they are to be replaced at).
+# Lets managers sharing an offline token skip the exchange while its access
+# token has life left. Wall clock times are kept rather than monotonic
+# deadlines, which don't advance while a machine is suspended.
+_OFFLINE_TOKENS: Dict[Tuple[str, str, str, bytes], Tuple[Tokens, float]] = {}
+_OFFLINE_TOKENS_LOCK = threading.Lock()
+
+# _OFFLINE_TOKENS key -> (lock held while exchanging that offline token,
+# number of threads using it). Guarded by _OFFLINE_TOKENS_LOCK, see
+# _offline_exchange_lock.
+_OFFLINE_EXCHANGE_LOCKS: Dict[Tuple[str, str, str, bytes],
+                              Tuple[threading.Lock, int]] = {}
+
+# jwt.decode settings used when validating access tokens. The options are
+# cast at the jwt.decode calls as PyJWT's Options type only exists in newer
+# releases than the ones supported.
+JWT_ALGORITHMS = ["RS256"]
+JWT_DECODE_OPTIONS = {
+    "verify_signature": True,
+    "verify_aud": False,
+    "verify_exp": True
+}
+
+# Content type of the pre-encoded keycloak request bodies - requests only
+# sets it itself when given a dict
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+# (connect, read) timeouts (s) for requests to the keycloak token and device
+# endpoints so a stalled server can't hang a refresh or device flow forever
+KEYCLOAK_REQUEST_TIMEOUT = (3.05, 10)
+
+# Shared session so that repeated calls to the keycloak endpoints reuse
+# pooled keep-alive connections instead of performing a new TLS handshake.
+# Connection errors are retried with exponential backoff so a network blip
+# doesn't abort an in progress device auth flow. Only GETs are retried after
+# read errors and transient server errors - a token grant POST may already
+# have been processed, and replaying it would fail once keycloak has rotated
+# the refresh token. The final response of a GET is returned rather than
+# raising RetryError so it reaches the usual status checks.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False
+    )
+))
+
+
+def _empty_stage_tokens() -> StageTokens:
+    """Builds a StageTokens object with no tokens for any stage.
+
+    Returns
+    -------
+    StageTokens
+        The empty (unvalidated) StageTokens object
+    """
+    return StageTokens.construct(stages=dict.fromkeys(Stage))
+
 
 class AuthFlow(str, Enum):
     DEVICE = "DEVICE"
     OFFLINE = "OFFLINE"
 
 
+def _file_signature(location: str) -> Tuple[int, int, int]:
+    """Identifies the current version of a file. The inode and size are
+    included as well as the modification time so that a replaced file is
+    noticed on filesystems with coarse timestamps.
+
+    Parameters
+    ----------
+    location : str
+        The file path
+
+    Returns
+    -------
+    Tuple[int, int, int]
+        The inode, modification time (ns) and size of the file
+    """
+    stat = os.stat(location)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _write_file_atomic(location: str, data: bytes) -> None:
+    """Writes data to a temporary file then renames it over location, so
+    an interrupted write can never leave a truncated file behind.
+
+    Parameters
+    ----------
+    location : str
+        The file to write
+    data : bytes
+        The new file contents
+    """
+    # a unique temporary file per write so concurrent writers sharing the
+    # location don't replace or remove each other's temporary file
+    fd, temporary_location = tempfile.mkstemp(
+        dir=os.path.dirname(location) or ".",
+        prefix=os.path.basename(location) + ".",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_location, location)
+    except BaseException:
+        try:
+            os.unlink(temporary_location)
+        except OSError:
+            pass
+        raise
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_stage(stage: str) -> Stage:
+    """Looks up the Stage with the given name.
+
+    Parameters
+    ----------
+    stage : str
+        The stage name
+
+    Returns
+    -------
+    Stage
+        The matching stage
+
+    Raises
+    ------
+    ValueError
+        If the stage name is invalid.
+    """
+    try:
+        return Stage[stage]
+    except KeyError:
+        raise ValueError(f"Stage {stage} is not one of {list(Stage)}.")
+
+
+def _unverified_claims(access_token: str) -> Optional[Dict[str, Any]]:
+    """Reads the claims of a JWT without verifying it. This is only
+    safe to use for rejecting tokens, never for accepting them.
+
+    Parameters
+    ----------
+    access_token : str
+        The encoded JWT
+
+    Returns
+    -------
+    Optional[Dict[str, Any]]
+        The claims, or None if they could not be read
+    """
+    try:
+        payload = access_token.split(".")[1]
+        claims = _json_loads(base64.urlsafe_b64decode(
+            payload + "=" * (-len(payload) % 4)))
+    except (IndexError, TypeError, ValueError):
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+def _unverified_expiry(access_token: str) -> Optional[float]:
+    """Reads the exp claim of a JWT without verifying it. This is only
+    safe to use for rejecting tokens, never for accepting them.
+
+    Parameters
+    ----------
+    access_token : str
+        The encoded JWT
+
+    Returns
+    -------
+    Optional[float]
+        The exp claim, or None if it could not be read
+    """
+    claims = _unverified_claims(access_token)
+    try:
+        return float(claims["exp"]) if claims is not None else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _stale_at(claims: Dict[str, Any]) -> Optional[float]:
+    """The unix time after which a token is treated as expired. This is
+    TOKEN_EXPIRY_MARGIN before its expiry, with the margin capped at half
+    of the token's lifetime when it has an iat claim.
+
+    Parameters
+    ----------
+    claims : Dict[str, Any]
+        The token claims
+
+    Returns
+    -------
+    Optional[float]
+        The time, or None if the token has no valid exp claim
+    """
+    try:
+        exp = float(claims["exp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    margin: float = TOKEN_EXPIRY_MARGIN
+    try:
+        margin = max(0.0, min(margin, (exp - float(claims["iat"])) / 2))
+    except (KeyError, TypeError, ValueError):
+        pass
+    return exp - margin
+
+
+def _cached_offline_tokens(cache_key: Tuple[str, str, str, bytes]) -> Optional[Tokens]:
+    """Looks up the tokens from a previous offline token exchange.
+
+    Parameters
+    ----------
+    cache_key : Tuple[str, str, str, bytes]
+        The _OFFLINE_TOKENS key of the exchange
+
+    Returns
+    -------
+    Optional[Tokens]
+        The tokens, or None if there are none or they are due to be
+        replaced. Tokens past that point are removed.
+    """
+    cached = _OFFLINE_TOKENS.get(cache_key)
+    if cached is None:
+        return None
+    if time.time() < cached[1]:
+        return cached[0]
+    # drop stale tokens rather than keep them in memory until the next
+    # exchange replaces them - unless another thread already has
+    with _OFFLINE_TOKENS_LOCK:
+        if _OFFLINE_TOKENS.get(cache_key) is cached:
+            del _OFFLINE_TOKENS[cache_key]
+    return None
+
+
+@contextmanager
+def _offline_exchange_lock(cache_key: Tuple[str, str, str, bytes]) -> Iterator[None]:
+    """Holds the lock for exchanging one offline token, so exchanges of
+    different offline tokens don't wait on each other. The lock is 
+    removed once no thread is using it.
+
+    Parameters
+    ----------
+    cache_key : Tuple[str, str, str, bytes]
+        The _OFFLINE_TOKENS key of the exchange
+    """
+    with _OFFLINE_TOKENS_LOCK:
+        lock, users = _OFFLINE_EXCHANGE_LOCKS.get(
+            cache_key, (threading.Lock(), 0))
+        _OFFLINE_EXCHANGE_LOCKS[cache_key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _OFFLINE_TOKENS_LOCK:
+            lock, users = _OFFLINE_EXCHANGE_LOCKS[cache_key]
+            if users > 1:
+                _OFFLINE_EXCHANGE_LOCKS[cache_key] = (lock, users - 1)
+            else:
+                del _OFFLINE_EXCHANGE_LOCKS[cache_key]
+
+
+def _browser_available() -> bool:
+    """Checks whether a web-browser could plausibly be opened. On linux this
+    requires a display server (or an explicit BROWSER), other platforms are
+    assumed to have one.
+
+    Returns
+    -------
+    bool
+        True if opening a browser should be attempted
+    """
+    if not sys.platform.startswith("linux"):
+        return True
+    return any(
+        os.environ.get(var) for var in ("DISPLAY", "WAYLAND_DISPLAY", "BROWSER")
+    )
+
+
 class DeviceFlowManager:
     def __init__(
         self,
@@ -62,7 +416,7 @@ class DeviceFlowManager:
         client_id: str = DEFAULT_CLIENT_ID,
         local_storage_location: Optional[str] = None,
         local_storage_object: Optional[Dict[str, Any]] = None,
-        scopes: List[str] = [],
+        scopes: Optional[List[str]] = None,
         force_token_refresh: bool = False,
         silent: bool = False
     ) -> None:
@@ -90,8 +444,9 @@ class DeviceFlowManager:
         local_storage_location : str, optional
             The storage location for caching creds, by default
             LOCAL_STORAGE_DEFAULT
-        scopes : List[str], optional
-            The scopes you want to request against client, by default []
+        scopes : Optional[List[str]], optional
+            The scopes you want to request against client, by default None
+            (no scopes)
         force_token_refresh : bool, optional
             If you want to force the manager to dump current creds, by default
             False
@@ -112,6 +467,10 @@ class DeviceFlowManager:
                 "Can't specify both local storage file and object.")
 
         self.storage_type: StorageType = StorageType.FILE
+        # (file signature, parsed contents) of the token storage file,
+        # see _load_file_tokens
+        self._file_tokens: Optional[
+            Tuple[Tuple[int, int, int], StageTokens]] = None
 
         if local_storage_object is None:
             self.storage_type = StorageType.FILE
@@ -148,14 +507,31 @@ class DeviceFlowManager:
 
         # initialise empty stage tokens
         self.stage_tokens: Optional[Tokens] = None
-        self.public_key: Optional[str] = None
-        self.scopes: List[str] = scopes
+        # fetched on first use, see the public_key property
+        self._public_key: Optional[str] = None
+        # parsed form of public_key so it isn't re-parsed on every validation
+        self._public_key_obj: Any = None
+        # auth object handed out by get_auth, reused while the token is
+        # unchanged
+        self._bearer_auth: Optional[BearerAuth] = None
+        self.scopes: List[str] = list(scopes) if scopes else []
+        # scope parameter as sent to keycloak, joined once up front
+        self._scope_str = " ".join(self.scopes)
+
+        # Request payloads are form encoded once - only the refresh token
+        # changes between refresh requests
+        self._device_auth_body = urlencode({
+            "client_id": self.client_id,
+            "scope": self._scope_str
+        })
+        self._refresh_body_prefix = urlencode({
+            "grant_type": "refresh_token",
+            "client_id": self.client_id,
+            "scope": self._scope_str
+        }) + "&refresh_token="
 
         # pull out stage
-        try:
-            self.stage: Stage = Stage[stage]
-        except:
-            raise ValueError(f"Stage {stage} is not one of {list(Stage)}.")
+        self.stage: Stage = _parse_stage(stage)
 
         # set endpoints
         self.token_endpoint = self.keycloak_endpoint + "/protocol/openid-connect/token"
@@ -165,9 +541,26 @@ class DeviceFlowManager:
         if force_token_refresh:
             self.reset_storage()
 
-        self.retrieve_keycloak_public_key()
         self.get_tokens()
 
+    @property
+    def public_key(self) -> Optional[str]:
+        """The keycloak realm public key (PEM). This is retrieved the first
+        time it is needed rather than when the manager is created.
+
+        Returns
+        -------
+        Optional[str]
+            The PEM encoded public key
+        """
+        if self._public_key is None:
+            self.retrieve_keycloak_public_key()
+        return self._public_key
+
+    @public_key.setter
+    def public_key(self, public_key: Optional[str]) -> None:
+        self._public_key = public_key
+
     def optional_print(self, message: Optional[str] = None) -> None:
         """Prints only if the silent value is not 
         flagged.
@@ -187,7 +580,8 @@ class DeviceFlowManager:
         """Retrieves credentials from a local cache file, if present. 
         Credentials are on a per stage basis. If the creds are valid
         but expired, they will be refreshed. If this fails, then 
-        a failure is indicated by None. 
+        a failure is indicated by None. Tokens are not cached for
+        the OFFLINE auth flow so this always gives None in that case.
 
         Parameters
         ----------
@@ -199,67 +593,56 @@ class DeviceFlowManager:
         Optional[Tokens]
             Tokens object if successful or None.
         """
+        tokens, _ = self._retrieve_local_tokens(stage)
+        return tokens
 
-        if self.storage_type == StorageType.FILE:
-            self.optional_print(
-                "Looking for existing tokens in local storage.")
-            self.optional_print("")
-            # Try to read file
-            try:
-                stage_tokens = StageTokens.parse_file(
-                    self.token_storage_location)
-                tokens = stage_tokens.stages.get(stage)
-                assert tokens
-            except:
-                self.optional_print(
-                    f"No local storage tokens for stage {stage} found.")
-                self.optional_print("")
-                return None
-        elif self.storage_type == StorageType.OBJECT:
+    def _retrieve_local_tokens(self, stage: Stage) -> Tuple[Optional[Tokens], bool]:
+        """See retrieve_local_tokens. Also reports whether the tokens 
+        were refreshed, in which case they differ from those in storage.
+
+        Parameters
+        ----------
+        stage : Stage
+            The stage to fetch creds for.
+
+        Returns
+        -------
+        Tuple[Optional[Tokens], bool]
+            Tokens object if successful or None, and whether a refresh
+            was performed.
+        """
+        if self.auth_flow == AuthFlow.OFFLINE:
+            # tokens are not cached for the offline workflow - they are
+            # regenerated using the offline token
+            return None, False
+
+        self.optional_print("Looking for existing tokens in local storage.\n")
+        stage_tokens = self._load_stage_tokens()
+        tokens = stage_tokens.stages.get(stage) if stage_tokens else None
+        if tokens is None:
             self.optional_print(
-                "Looking for existing tokens in provided object.")
-            self.optional_print("")
-            # Try to read object
-            try:
-                stage_tokens = StageTokens.parse_obj(self.object_storage)
-                tokens = stage_tokens.stages.get(stage)
-                assert tokens
-            except:
-                self.optional_print(
-                    f"No local storage tokens in provided storage for {stage}.")
-                self.optional_print("")
-                return None
+                f"No local storage tokens for stage {stage} found.\n")
+            return None, False
 
         # Validate
-        self.optional_print("Validating found tokens")
-        self.optional_print()
+        self.optional_print("Validating found tokens\n")
         valid = True
         try:
             self.validate_token(tokens=tokens)
-        except:
+        except Exception:
+            # invalid/expired token or public key unavailable
             valid = False
 
         # Return the tokens found if valid
         if valid:
-            self.optional_print("Found tokens valid, using.")
-            self.optional_print()
-            return tokens
-
-        elif self.auth_flow == AuthFlow.OFFLINE:
-            # no refresh from storage is available using the offline workflow as
-            # they are not cached
-            self.optional_print(
-                "Refresh not cached for offline workflow - regenerating using offline token."
-            )
-            self.optional_print()
-            return None
+            self.optional_print("Found tokens valid, using.\n")
+            return tokens, False
 
         # Tokens found but were invalid, try refreshing
         refresh_succeeded = True
         try:
             self.optional_print(
-                "Trying to use found tokens to refresh the access token.")
-            self.optional_print()
+                "Trying to use found tokens to refresh the access token.\n")
             refreshed = self.perform_refresh(tokens=tokens)
 
             # unpack response and return access token
@@ -267,28 +650,68 @@ class DeviceFlowManager:
             refresh_token = refreshed.get('refresh_token')
 
             # Make sure they are preset
-            assert access_token
-            assert refresh_token
+            if not access_token or not refresh_token:
+                raise Exception(
+                    "Refresh response did not include access or refresh token.")
 
-            tokens = Tokens(
+            tokens = Tokens.construct(
                 access_token=access_token,
                 refresh_token=refresh_token
             )
             self.validate_token(tokens)
-        except:
+        except Exception:
             refresh_succeeded = False
 
         # If refresh fails for some reason then return None
         # otherwise return the tokens
         if refresh_succeeded:
-            self.optional_print("Token refresh successful.")
-            self.optional_print()
-            return tokens
+            self.optional_print("Token refresh successful.\n")
+            return tokens, True
         else:
             self.optional_print(
-                "Tokens found in storage but they are not valid.")
-            self.optional_print()
+                "Tokens found in storage but they are not valid.\n")
+            return None, False
+
+    def _load_file_tokens(self) -> Optional[StageTokens]:
+        """Reads the token storage file. The file is only parsed again
+        if it has changed (see _file_signature) since it was last read or 
+        written by this manager, otherwise the in memory copy is returned.
+
+        Returns
+        -------
+        Optional[StageTokens]
+            The stored tokens or None if the file is missing or invalid
+        """
+        try:
+            signature = _file_signature(self.token_storage_location)
+        except OSError:
+            # Missing on first run
+            return None
+        if self._file_tokens is not None and self._file_tokens[0] == signature:
+            return self._file_tokens[1]
+        try:
+            stage_tokens = StageTokens.parse_file(self.token_storage_location)
+        except (ValueError, OSError):
+            # Corrupt or unreadable file - invalid JSON and pydantic
+            # validation errors are both ValueErrors
             return None
+        self._file_tokens = (signature, stage_tokens)
+        return stage_tokens
+
+    def _write_file_tokens(self, stage_tokens: StageTokens, data: bytes) -> None:
+        """Writes serialised tokens to the token storage file and 
+        remembers them so that _load_file_tokens doesn't read them back.
+
+        Parameters
+        ----------
+        stage_tokens : StageTokens
+            The tokens being written
+        data : bytes
+            The serialised tokens
+        """
+        _write_file_atomic(self.token_storage_location, data)
+        self._file_tokens = (
+            _file_signature(self.token_storage_location), stage_tokens)
 
     def reset_storage(self) -> None:
         """Resets the local storage by setting all 
@@ -297,18 +720,11 @@ class DeviceFlowManager:
 
         if self.storage_type == StorageType.FILE:
             self.optional_print("Flushing tokens from local storage.")
-            cleared_tokens = StageTokens(
-                stages={
-                    Stage.TEST: None,
-                    Stage.DEV: None,
-                    Stage.STAGE: None,
-                    Stage.PROD: None
-                }
-            )
+            cleared_tokens = _empty_stage_tokens()
 
             # Dump the cleared file into storage
-            with open(self.token_storage_location, 'w') as f:
-                f.write(cleared_tokens.json())
+            self._write_file_tokens(
+                cleared_tokens, _json_dumps(cleared_tokens.dict()))
         elif self.storage_type == StorageType.OBJECT:
             self.object_storage.clear()
 
@@ -316,7 +732,8 @@ class DeviceFlowManager:
         """Pulls the current StageTokens object from cache
         storage, if present, then either updates the current
         stage token value in existing or new StageTokens 
-        object. Writes back to file.
+        object. Writes back to file if anything changed. Does 
+        nothing for the OFFLINE auth flow.
 
         Parameters
         ----------
@@ -324,82 +741,64 @@ class DeviceFlowManager:
             The stage to update
         """
         # Check current tokens
-        assert self.tokens
-        existing: Optional[bool] = None
-        existing_tokens: Optional[StageTokens] = None
+        if self.tokens is None:
+            raise Exception("Cannot update storage without tokens.")
+
+        # Tokens are never cached for the offline workflow, a new process
+        # regenerates them using the offline token
+        if self.auth_flow == AuthFlow.OFFLINE:
+            return
+
+        previous_tokens = self._load_stage_tokens()
+        # Update a copy so that the cached tokens are only replaced once
+        # the write has succeeded
+        if previous_tokens is not None:
+            # We have existing - update current stage
+            new_tokens = previous_tokens.copy(deep=True)
+        else:
+            new_tokens = _empty_stage_tokens()
+        new_tokens.stages[stage] = self.tokens
+
+        # Nothing to write if the stored tokens are unchanged
+        if new_tokens == previous_tokens:
+            return
+
+        self._save_stage_tokens(new_tokens)
 
+    def _load_stage_tokens(self) -> Optional[StageTokens]:
+        """Reads the StageTokens object from the configured storage.
+
+        Returns
+        -------
+        Optional[StageTokens]
+            The stored tokens or None if there are none or they are invalid
+        """
         if self.storage_type == StorageType.FILE:
-            try:
-                existing_tokens = StageTokens.parse_file(
-                    self.token_storage_location)
-                existing = True
-            except:
-                existing = False
-
-            assert existing is not None
-            if existing:
-                # We have existing - update current stage
-                assert existing_tokens
-
-                existing_tokens.stages[stage] = self.tokens
-            else:
-                existing_tokens = StageTokens(
-                    stages={
-                        Stage.TEST: None,
-                        Stage.DEV: None,
-                        Stage.STAGE: None,
-                        Stage.PROD: None
-                    }
-                )
-                existing_tokens.stages[stage] = self.tokens
-
-            # if OFFLINE mode then remove all refresh tokens from the object so
-            # that we never cache refresh tokens
-
-            if self.auth_flow == AuthFlow.OFFLINE:
-                for stage, tokens in existing_tokens.stages.items():
-                    if tokens:
-                        tokens.refresh_token = None
+            return self._load_file_tokens()
+        try:
+            return StageTokens.parse_obj(self.object_storage)
+        except ValidationError:
+            return None
 
+    def _save_stage_tokens(self, stage_tokens: StageTokens) -> None:
+        """Writes the StageTokens object to the configured storage.
+
+        Parameters
+        ----------
+        stage_tokens : StageTokens
+            The tokens to store
+        """
+        new = stage_tokens.dict(exclude_none=True)
+        if self.storage_type == StorageType.FILE:
             # Dump the file into storage
-            with open(self.token_storage_location, 'w') as f:
-                f.write(existing_tokens.json(exclude_none=True))
-        elif self.storage_type == StorageType.OBJECT:
-            try:
-                existing_tokens = StageTokens.parse_obj(
-                    self.object_storage)
-                existing = True
-            except:
-                existing = False
-
-            assert existing is not None
-            if existing:
-                # We have existing - update current stage
-                assert existing_tokens
-
-                existing_tokens.stages[stage] = self.tokens
-            else:
-                existing_tokens = StageTokens(
-                    stages={
-                        Stage.TEST: None,
-                        Stage.DEV: None,
-                        Stage.STAGE: None,
-                        Stage.PROD: None
-                    }
-                )
-                existing_tokens.stages[stage] = self.tokens
-
-            if self.auth_flow == AuthFlow.OFFLINE:
-                for stage, tokens in existing_tokens.stages.items():
-                    if tokens:
-                        tokens.refresh_token = None
-
-            # update local storage object
+            self._write_file_tokens(stage_tokens, _json_dumps(new))
+        else:
+            # update local storage object - stage keys are stored as plain
+            # strings, as they would be after a JSON round trip
             self.object_storage.clear()
-            new = json.loads(
-                existing_tokens.json(exclude_none=True))
-            for k, v in new.items():
-                self.object_storage[k] = v
+            self.object_storage['stages'] = {
+                stage.value: tokens for stage, tokens in new['stages'].items()
+            }
 
     def perform_offline_refresh(self) -> Dict[str, Any]:
         """
@@ -417,25 +816,22 @@ class DeviceFlowManager:
         Exception
             Exception if non 200 status code
         """
-        # Perform a refresh grant
-        refresh_grant_type = "refresh_token"
+        if not self.offline_token:
+            raise Exception("Cannot refresh without an offline token.")
 
-        # Required openid connect fields
-        data = {
-            "grant_type": refresh_grant_type,
-            "client_id": self.client_id,
-            "refresh_token": self.offline_token,
-            "scope": " ".join(self.scopes)
-        }
+        # Perform a refresh grant with the required openid connect fields
+        data = self._refresh_body_prefix + quote_plus(self.offline_token)
 
         # Send API request
-        response = requests.post(self.token_endpoint, data=data)
+        response = _SESSION.post(
+            self.token_endpoint, data=data, headers=FORM_HEADERS,
+            timeout=KEYCLOAK_REQUEST_TIMEOUT)
 
         if (not response.status_code == 200):
             raise Exception(
                 f"Something went wrong during offline token refresh. Status code: {response.status_code}.")
 
-        return response.json()
+        return _json_loads(response.content)
 
     def get_tokens(self) -> None:
         """Tries to get tokens. 
@@ -452,14 +848,15 @@ class DeviceFlowManager:
         """
         # Try getting from local storage first
         # These are always validated
-        self.optional_print("Attempting to generate authorisation tokens.")
-        self.optional_print()
+        self.optional_print("Attempting to generate authorisation tokens.\n")
 
         # try to get from local storage and attempt auto refresh
-        retrieved_tokens = self.retrieve_local_tokens(self.stage)
+        retrieved_tokens, refreshed = self._retrieve_local_tokens(self.stage)
         if retrieved_tokens:
             self.tokens = retrieved_tokens
-            self.update_local_storage(self.stage)
+            # storage already holds these tokens unless they were refreshed
+            if refreshed:
+                self.update_local_storage(self.stage)
             return
 
         # Otherwise do a normal authorisation flow
@@ -470,29 +867,28 @@ class DeviceFlowManager:
             device_grant_type = "urn:ietf:params:oauth:grant-type:device_code"
 
             self.optional_print(
-                "Initiating device auth flow to generate access and refresh tokens.")
-            self.optional_print()
+                "Initiating device auth flow to generate access and refresh tokens.\n")
             device_auth_response = self.initiate_device_auth_flow()
 
-            self.optional_print("Decoding response")
-            self.optional_print()
+            self.optional_print("Decoding response\n")
             device_code = device_auth_response['device_code']
             user_code = device_auth_response['user_code']
             verification_uri = device_auth_response['verification_uri_complete']
             interval = device_auth_response['interval']
+            expires_in = device_auth_response.get(
+                'expires_in', DEFAULT_DEVICE_CODE_LIFESPAN)
 
             self.optional_print(
-                "Please authorise using the following endpoint.")
-            self.optional_print()
+                "Please authorise using the following endpoint.\n")
             self.display_device_auth_flow(user_code, verification_uri)
             self.optional_print()
 
-            self.optional_print("Awaiting completion")
-            self.optional_print()
+            self.optional_print("Awaiting completion\n")
             oauth_tokens = self.await_device_auth_flow_completion(
                 device_code=device_code,
                 interval=interval,
                 grant_type=device_grant_type,
+                expires_in=expires_in,
             )
             self.optional_print()
 
@@ -506,27 +902,69 @@ class DeviceFlowManager:
             refresh_token = oauth_tokens.get('refresh_token')
 
             # Check that they are present
-            try:
-                assert access_token is not None
-                assert refresh_token is not None
-            except Exception as e:
+            if access_token is None or refresh_token is None:
                 raise Exception(
-                    f"Token payload did not include access or refresh token: Error: {e}")
+                    "Token payload did not include access or refresh token.")
             # Set tokens
-            self.tokens = Tokens(
+            self.tokens = Tokens.construct(
                 access_token=access_token,
                 refresh_token=refresh_token
             )
             self.update_local_storage(self.stage)
 
             self.optional_print(
-                "Token generation complete. Authorisation successful.")
-            self.optional_print()
+                "Token generation complete. Authorisation successful.\n")
 
         elif self.auth_flow == AuthFlow.OFFLINE:
             # offline auth flow
 
-            # perform offline refresh
+            # exchange the offline token, reusing a recent exchange if possible
+            self.tokens = self._exchange_offline_token()
+            self.update_local_storage(self.stage)
+
+            self.optional_print(
+                "Offline token generation complete. Authorisation successful.\n")
+
+    def _exchange_offline_token(self) -> Tokens:
+        """Exchanges the offline token for access and refresh tokens
+        using perform_offline_refresh. The result is shared by all 
+        managers in the process using the same offline token, client
+        and scopes until the access token is within TOKEN_EXPIRY_MARGIN 
+        of its expiry (the exp claim, or expires_in if it has none), or 
+        half way through its life if it was issued for less than 
+        SHORT_TOKEN_LIFETIME.
+
+        Returns
+        -------
+        Tokens
+            The exchanged tokens
+
+        Raises
+        ------
+        Exception
+            Tokens not present in the keycloak token endpoint response
+        """
+        if not self.offline_token:
+            raise Exception("Cannot exchange without an offline token.")
+        cache_key = (
+            self.token_endpoint,
+            self.client_id,
+            self._scope_str,
+            hashlib.sha256(self.offline_token.encode()).digest()
+        )
+        tokens = _cached_offline_tokens(cache_key)
+        if tokens is not None:
+            return tokens
+
+        # Only one thread exchanges each offline token at a time so that
+        # threads which find the cache empty together don't each make the
+        # same exchange
+        with _offline_exchange_lock(cache_key):
+            # another thread may have exchanged while this one waited
+            tokens = _cached_offline_tokens(cache_key)
+            if tokens is not None:
+                return tokens
+
             oauth_tokens = self.perform_offline_refresh()
 
             # pull out the refresh and access token
@@ -535,31 +973,42 @@ class DeviceFlowManager:
             refresh_token = oauth_tokens.get('refresh_token')
 
             # Check that they are present
-            try:
-                assert access_token is not None
-                assert refresh_token is not None
-            except Exception as e:
+            if access_token is None or refresh_token is None:
                 raise Exception(
-                    f"Offline refresh token payload did not include access or refresh token: Error: {e}")
+                    "Offline refresh token payload did not include access or refresh token.")
 
-            # Set tokens
-            self.tokens = Tokens(
+            tokens = Tokens.construct(
                 access_token=access_token,
                 refresh_token=refresh_token
             )
-            self.update_local_storage(self.stage)
-
-            self.optional_print(
-                "Offline token generation complete. Authorisation successful.")
-            self.optional_print()
+            # the token's own exp claim is used as is - only tokens without
+            # one fall back to expires_in, which is relative to when it was
+            # issued
+            now = time.time()
+            expires_at = _unverified_expiry(access_token)
+            if expires_at is None and oauth_tokens.get('expires_in'):
+                expires_at = now + oauth_tokens['expires_in']
+            if expires_at is not None:
+                lifetime = expires_at - now
+                if lifetime < SHORT_TOKEN_LIFETIME:
+                    # short lived tokens are replaced at half life so they
+                    # are never handed out with only seconds left
+                    replace_at = now + lifetime / 2
+                else:
+                    replace_at = expires_at - TOKEN_EXPIRY_MARGIN
+                with _OFFLINE_TOKENS_LOCK:
+                    _OFFLINE_TOKENS[cache_key] = (tokens, replace_at)
+            return tokens
 
     def perform_token_refresh(self) -> None:
         """Updates the current tokens by using the refresh token.
+        Connection errors are retried by the session (see _SESSION), 
+        so a network blip doesn't escalate to a new authorisation flow.
         """
-        assert self.tokens is not None
+        if self.tokens is None:
+            raise Exception("Cannot refresh without tokens.")
 
-        self.optional_print("Refreshing using refresh token")
-        self.optional_print()
+        self.optional_print("Refreshing using refresh token\n")
 
         refreshed = self.perform_refresh()
 
@@ -568,10 +1017,11 @@ class DeviceFlowManager:
         refresh_token = refreshed.get('refresh_token')
 
         # Make sure they are preset
-        assert access_token
-        assert refresh_token
+        if not access_token or not refresh_token:
+            raise Exception(
+                "Refresh response did not include access or refresh token.")
 
-        self.tokens = Tokens(
+        self.tokens = Tokens.construct(
             access_token=access_token,
             refresh_token=refresh_token
         )
@@ -597,9 +1047,6 @@ class DeviceFlowManager:
         Exception
             Non 200 response code.
         """
-        # Perform a refresh grant
-        refresh_grant_type = "refresh_token"
-
         # make sure we have tokens to use
         desired_tokens: Optional[Tokens]
         if tokens:
@@ -607,25 +1054,23 @@ class DeviceFlowManager:
         else:
             desired_tokens = self.tokens
 
-        assert desired_tokens
-        assert desired_tokens.refresh_token
+        if desired_tokens is None or not desired_tokens.refresh_token:
+            raise Exception("Cannot refresh without a refresh token.")
 
-        # Required openid connect fields
-        data = {
-            "grant_type": refresh_grant_type,
-            "client_id": self.client_id,
-            "refresh_token": desired_tokens.refresh_token,
-            "scope": " ".join(self.scopes)
-        }
+        # Perform a refresh grant with the required openid connect fields
+        data = self._refresh_body_prefix + \
+            quote_plus(desired_tokens.refresh_token)
 
         # Send API request
-        response = requests.post(self.token_endpoint, data=data)
+        response = _SESSION.post(
+            self.token_endpoint, data=data, headers=FORM_HEADERS,
+            timeout=KEYCLOAK_REQUEST_TIMEOUT)
 
         if (not response.status_code == 200):
             raise Exception(
                 f"Something went wrong during token refresh. Status code: {response.status_code}.")
 
-        return response.json()
+        return _json_loads(response.content)
 
     def initiate_device_auth_flow(self) -> Dict[str, Any]:
         """Initiates OAuth device flow. 
@@ -638,38 +1083,32 @@ class DeviceFlowManager:
         Dict[str, Any]
             The json response info from the device auth flow endpoint
         """
-        data = {
-            "client_id": self.client_id,
-            "scope": ' '.join(self.scopes)
-        }
-        response = requests.post(self.device_endpoint, data=data).json()
-        return response
+        response = _SESSION.post(
+            self.device_endpoint, data=self._device_auth_body, headers=FORM_HEADERS,
+            timeout=KEYCLOAK_REQUEST_TIMEOUT)
+        return _json_loads(response.content)
 
-    def get_token(self) -> str:
-        """Uses the current token - validates it, 
-        refreshes if necessary, and returns the valid token
-        ready to be used.
+    def _ensure_valid_token(self) -> str:
+        """Validates the current access token, refreshing it or starting
+        a new authorisation flow if necessary. Shared by get_token and
+        get_auth.
 
         Returns
         -------
         str
-            The access token
+            The valid access token
 
         Raises
         ------
         Exception
-            Raises exception if tokens/public_key are not setup - make sure 
-            that the object is instantiated properly before calling this function
+            Raises exception if tokens are not setup - make sure that the
+            object is instantiated properly before calling this function
         Exception
             If the token is invalid and cannot be refreshed
         """
-        # make auth object using access_token
-        if (self.tokens is None or self.public_key is None):
+        if self.tokens is None:
             raise Exception(
-                "cannot generate token without access token or public key")
-
-        assert self.tokens
-        assert self.public_key
+                "cannot generate token without access token")
 
         # are tokens valid?
         try:
@@ -691,6 +1130,26 @@ class DeviceFlowManager:
                         f"Device log in failed, access token expired/invalid, and refresh failed. Error: {e}")
         return self.tokens.access_token
 
+    def get_token(self) -> str:
+        """Uses the current token - validates it, 
+        refreshes if necessary, and returns the valid token
+        ready to be used.
+
+        Returns
+        -------
+        str
+            The access token
+
+        Raises
+        ------
+        Exception
+            Raises exception if tokens are not setup - make sure 
+            that the object is instantiated properly before calling this function
+        Exception
+            If the token is invalid and cannot be refreshed
+        """
+        return self._ensure_valid_token()
+
     def get_auth(self) -> BearerAuth:
         """A helper function which produces a BearerAuth object for use
         in the requests.xxx objects. For example: 
@@ -699,6 +1158,9 @@ class DeviceFlowManager:
         auth = manager.get_auth 
         requests.post(..., auth=auth)
 
+        The same BearerAuth object is returned while the access token
+        is unchanged.
+
         Returns
         -------
         BearerAuth
@@ -711,46 +1173,71 @@ class DeviceFlowManager:
         Exception
             Token validation failed and refresh or device auth failed
         """
-        # make auth object using access_token
-        if (self.tokens is None or self.public_key is None):
-            raise Exception(
-                "cannot generate bearer auth object without access token or public key")
-
-        assert self.tokens
-        assert self.public_key
+        access_token = self._ensure_valid_token()
+        if self._bearer_auth is None or self._bearer_auth.token != access_token:
+            self._bearer_auth = BearerAuth(token=access_token)
+        return self._bearer_auth
 
-        # are tokens valid?
-        try:
-            self.validate_token()
-        except Exception as e:
-            # tokens are invalid
-            self.optional_print(f"Token validation failed due to error: {e}")
-            # does token refresh work?
-            try:
-                self.perform_token_refresh()
-                self.validate_token()
-            except Exception as e:
-                try:
-                    # Does new token generation work?
-                    self.get_tokens()
-                    self.validate_token()
-                except Exception as e:
-                    raise Exception(
-                        f"Device log in failed, access token expired/invalid, and refresh failed. Error: {e}")
-        return BearerAuth(token=self.tokens.access_token)
-
-    def retrieve_keycloak_public_key(self) -> None:
+    def retrieve_keycloak_public_key(self, force_refresh: bool = False) -> None:
         """Given the keycloak endpoint, retrieves the advertised
-        public key.
+        public key. Keys are cached per endpoint for PUBLIC_KEY_CACHE_TTL
+        seconds and shared between manager instances. Once stale, a cached
+        key is revalidated with a conditional request where keycloak
+        provided an ETag or Last-Modified header.
         Based on https://github.com/nurgasemetey/fastapi-keycloak-oidc/blob/main/main.py
+
+        Parameters
+        ----------
+        force_refresh : bool, optional
+            Ignore any cached key and fetch it again, by default False
         """
+        cached = _PUBLIC_KEY_CACHE.get(self.keycloak_endpoint)
+        if cached is None and not force_refresh:
+            cached = self._load_stored_public_key()
+        if cached and not force_refresh:
+            public_key, public_key_obj, retrieved_at, _ = cached
+            if time.monotonic() - retrieved_at < PUBLIC_KEY_CACHE_TTL:
+                self.public_key = public_key
+                self._public_key_obj = public_key_obj
+                return
+
+        # cryptography is slow to import and only needed once a key is
+        # fetched, so it is imported here rather than at module level
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+        headers = {"Accept": "application/json"}
+        if cached:
+            headers.update(cached[3])
+
         error_message = f"Error finding public key from keycloak endpoint {self.keycloak_endpoint}."
         try:
-            r = requests.get(self.keycloak_endpoint,
+            r = _SESSION.get(self.keycloak_endpoint,
+                             headers=headers,
                              timeout=3)
             r.raise_for_status()
-            response_json = r.json()
-            self.public_key = f"-----BEGIN PUBLIC KEY-----\r\n{response_json['public_key']}\r\n-----END PUBLIC KEY-----"
+            if r.status_code == 304 and cached:
+                # Unchanged - keep using the cached key
+                public_key, public_key_obj, _, validators = cached
+                self.public_key = public_key
+                self._public_key_obj = public_key_obj
+                _PUBLIC_KEY_CACHE[self.keycloak_endpoint] = (
+                    public_key, public_key_obj, time.monotonic(), validators)
+                self._store_public_key(public_key, validators)
+                return
+
+            response_json = _json_loads(r.content)
+            public_key = f"-----BEGIN PUBLIC KEY-----\r\n{response_json['public_key']}\r\n-----END PUBLIC KEY-----"
+            self.public_key = public_key
+            self._public_key_obj = load_pem_public_key(public_key.encode())
+
+            validators = {}
+            if "ETag" in r.headers:
+                validators["If-None-Match"] = r.headers["ETag"]
+            if "Last-Modified" in r.headers:
+                validators["If-Modified-Since"] = r.headers["Last-Modified"]
+            _PUBLIC_KEY_CACHE[self.keycloak_endpoint] = (
+                public_key, self._public_key_obj, time.monotonic(), validators)
+            self._store_public_key(public_key, validators)
         except requests.exceptions.HTTPError as errh:
             self.optional_print(error_message)
             self.optional_print("Http Error:" + str(errh))
@@ -768,10 +1255,87 @@ class DeviceFlowManager:
             self.optional_print("An unknown error occured: " + str(err))
             raise err
 
+    def _public_key_storage_location(self) -> Optional[str]:
+        """The file public keys are persisted in, only used for FILE 
+        storage.
+
+        Returns
+        -------
+        Optional[str]
+            The file path or None if keys are not persisted
+        """
+        if self.storage_type != StorageType.FILE:
+            return None
+        return self.token_storage_location + PUBLIC_KEY_STORAGE_SUFFIX
+
+    def _load_stored_public_key(self) -> Optional[Tuple[str, Any, float, Dict[str, str]]]:
+        """Loads this endpoint's public key from the public key file into 
+        the module cache if it was stored less than PUBLIC_KEY_CACHE_TTL
+        seconds ago.
+
+        Returns
+        -------
+        Optional[Tuple[str, Any, float, Dict[str, str]]]
+            The cache entry or None if there is no usable stored key
+        """
+        location = self._public_key_storage_location()
+        if location is None or not os.path.exists(location):
+            return None
+        try:
+            with open(location, 'rb') as f:
+                stored = _json_loads(f.read())[self.keycloak_endpoint]
+            age = time.time() - stored['retrieved_at']
+            if not 0 <= age < PUBLIC_KEY_CACHE_TTL:
+                return None
+
+            from cryptography.hazmat.primitives.serialization import load_pem_public_key
+            public_key = stored['public_key']
+            cached = (
+                public_key,
+                load_pem_public_key(public_key.encode()),
+                time.monotonic() - age,
+                stored.get('validators', {})
+            )
+        except (KeyError, TypeError, ValueError, OSError):
+            # Missing endpoint, corrupt or unreadable file
+            return None
+
+        _PUBLIC_KEY_CACHE[self.keycloak_endpoint] = cached
+        return cached
+
+    def _store_public_key(self, public_key: str, validators: Dict[str, str]) -> None:
+        """Persists this endpoint's public key to the public key file,
+        keeping the entries of other endpoints. Failures are ignored as
+        the file is only a cache.
+
+        Parameters
+        ----------
+        public_key : str
+            The PEM public key
+        validators : Dict[str, str]
+            The conditional request headers to revalidate the key with
+        """
+        location = self._public_key_storage_location()
+        if location is None:
+            return
+        try:
+            stored: Dict[str, Any] = {}
+            if os.path.exists(location):
+                with open(location, 'rb') as f:
+                    stored = _json_loads(f.read())
+            stored[self.keycloak_endpoint] = {
+                'public_key': public_key,
+                'retrieved_at': time.time(),
+                'validators': validators
+            }
+            _write_file_atomic(location, _json_dumps(stored))
+        except (TypeError, ValueError, OSError):
+            pass
+
     def display_device_auth_flow(self, user_code: str, verification_url: str) -> None:
         """Displays the current device auth flow challenge - first by trying to 
-        open a browser window - if this fails then prints suggestion to stdout 
-        to try using the URL manually.
+        open a browser window (in a background thread) - if this fails then 
+        prints suggestion to stdout to try using the URL manually.
 
         Parameters
         ----------
@@ -782,29 +1346,46 @@ class DeviceFlowManager:
         """
         print(f"Verification URL: {verification_url}")
         print(f"User Code: {user_code}")
-        try:
-            webbrowser.open(verification_url)
-        except Exception:
-            print("Tried to open web-browser but failed. Please visit URL above.")
+
+        def open_browser() -> None:
+            import webbrowser
+            try:
+                webbrowser.open(verification_url)
+            except Exception:
+                print("Tried to open web-browser but failed. Please visit URL above.")
+
+        # On headless linux (CI, SSH sessions) xdg-open can stall for
+        # several seconds before giving up, so only try with a display
+        if not _browser_available():
+            print("No display available to open a web-browser. Please visit URL above.")
+            return
+
+        # Spawning the browser can block for a noticeable time, open it in
+        # the background so that polling can begin straight away
+        threading.Thread(target=open_browser, daemon=True).start()
 
     def await_device_auth_flow_completion(
         self,
         device_code: str,
         interval: int,
         grant_type: str,
+        expires_in: int = DEFAULT_DEVICE_CODE_LIFESPAN,
     ) -> Optional[Dict[str, Any]]:
         """Ping the token endpoint as specified in the OAuth standard
-        at the advertised polling rate until response is positive
-        or failure.
+        at the advertised polling rate until response is positive,
+        failure or the device code expires.
 
         Parameters
         ----------
         device_code : str
             The device code
         interval : int
-            The polling interval (ms)
+            The polling interval (s)
         grant_type : str
             The OAuth grant type
+        expires_in : int, optional
+            The lifespan of the device code (s), by default
+            DEFAULT_DEVICE_CODE_LIFESPAN
 
         Returns
         -------
@@ -816,56 +1397,89 @@ class DeviceFlowManager:
             "grant_type": grant_type,
             "device_code": device_code,
             "client_id": self.client_id,
-            "scope": " ".join(self.scopes)
+            "scope": self._scope_str
         }
 
-        # Setup success criteria
-        succeeded = False
-        timed_out = False
-        misc_fail = False
-
-        # start time
         response_data: Optional[Dict[str, Any]] = None
 
-        # get requests session for repeated queries
-        session = requests.session()
-
-        # Poll for success
-        while not succeeded and not timed_out and not misc_fail:
-            response = session.post(self.token_endpoint, data=data)
-            response_data = response.json()
-            assert response_data
-            if response_data.get('error'):
-                error = response_data['error']
-                if error != 'authorization_pending':
-                    misc_fail = True
-                # Wait appropriate OAuth poll interval
-                time.sleep(interval)
-            else:
-                # Successful as there was no error at the endpoint
+        # Poll for success - there is no point polling beyond the lifespan
+        # of the device code. The deadline uses the monotonic clock so
+        # wall-clock adjustments can't extend it.
+        deadline = time.monotonic() + expires_in
+        max_polls = max(1, expires_in // max(1, interval))
+        timed_out = True
+        for _ in range(max_polls):
+            response = _SESSION.post(
+                self.token_endpoint, data=data, timeout=KEYCLOAK_REQUEST_TIMEOUT)
+            try:
+                response_data = _json_loads(response.content)
+            except ValueError:
+                # Not a JSON body (e.g. gateway error page) - nothing to
+                # poll against
+                response_data = None
+                timed_out = False
+                break
+
+            if response.status_code == 200:
+                # Successful as the token endpoint issued tokens
                 return response_data
 
-        try:
-            assert response_data
-            self.optional_print(f"Failed due to {response_data['error']}")
-            return None
-        except Exception as e:
+            error = response_data.get('error') if response_data else None
+            if error == 'slow_down':
+                # RFC 8628 section 3.5 - increase the interval by 5 seconds
+                interval += 5
+            elif error != 'authorization_pending':
+                # Any other error is terminal so stop polling straight away
+                timed_out = False
+                break
+
+            # Slow responses and slow_down both stretch the polling, so stop
+            # once the next poll would land after the device code expires
+            if time.monotonic() + interval >= deadline:
+                break
+            # Wait appropriate OAuth poll interval - never poll faster than
+            # the advertised interval, only slightly slower
+            time.sleep(interval + random.uniform(0, DEVICE_POLL_JITTER))
+
+        if timed_out:
             self.optional_print(
-                f"Failed with unknown error, failed to find error message. Error {e}")
+                "Timed out waiting for device authorisation to complete.")
             return None
 
+        if response_data and response_data.get('error'):
+            self.optional_print(f"Failed due to {response_data['error']}")
+        else:
+            self.optional_print(
+                "Failed with unknown error, failed to find error message.")
+        return None
+
     def validate_token(self, tokens: Optional[Tokens] = None) -> None:
-        """Uses the python-jose library to validate current creds.
+        """Uses the PyJWT library to validate current creds.
 
         In this context, it is basically just checking signature
         and expiry. The tokens are enforced at the API side 
-        as well.
+        as well. Tokens expiring within TOKEN_EXPIRY_MARGIN seconds
+        (at most half their lifetime, see _stale_at) are 
+        considered expired. Verified tokens are remembered (see
+        _VALIDATED_TOKENS) so repeat calls only check their expiry.
 
         Parameters
         ----------
         tokens : Optional[Tokens], optional
             The tokens object to validate, by default None
+
+        Raises
+        ------
+        ExpiredSignatureError
+            If the token has expired or expires within the margin
+        InvalidSignatureError
+            If the signature does not match the current realm key
         """
+        # PyJWT (and cryptography) are slow to import so are only imported
+        # once tokens are validated
+        import jwt
+        from jwt import ExpiredSignatureError
+
         # Validate either self.tokens or supply tokens optionally
         test_tokens: Optional[Tokens]
         if tokens:
@@ -874,20 +1488,68 @@ class DeviceFlowManager:
             test_tokens = self.tokens
 
         # Check tokens are present
-        assert test_tokens
-        assert self.public_key
+        if test_tokens is None:
+            raise Exception("No tokens to validate.")
+
+        # This exact token has already been verified - only the expiry
+        # needs checking again
+        token_key = (self.keycloak_endpoint, hashlib.sha256(
+            test_tokens.access_token.encode()).digest())
+        stale_at = _VALIDATED_TOKENS.get(token_key)
+        if stale_at is not None:
+            if time.time() > stale_at:
+                raise ExpiredSignatureError(
+                    "Token is expired or about to expire.")
+            try:
+                _VALIDATED_TOKENS.move_to_end(token_key)
+            except KeyError:
+                # evicted by another thread in the meantime
+                pass
+            return
+
+        # Expired tokens (e.g. read back from storage) can be rejected
+        # without paying for a signature verification
+        claims = _unverified_claims(test_tokens.access_token)
+        stale_at = _stale_at(claims) if claims is not None else None
+        if stale_at is not None and time.time() > stale_at:
+            raise ExpiredSignatureError(
+                "Token is expired or about to expire.")
+
+        # Reading the public key retrieves it on first use
+        if self.public_key is None:
+            raise Exception("Cannot validate token without the public key.")
 
         # this is currently locally validating the token
         # It is our responsibility to choose whether to honour the expiration date
         # etc
         # this will throw an exception if invalid
-        jwt_payload = jwt.decode(
-            test_tokens.access_token,
-            self.public_key,
-            algorithms=[ALGORITHMS.RS256],
-            options={
-                "verify_signature": True,
-                "verify_aud": False,
-                "exp": True
-            }
-        )
+        try:
+            jwt_payload = jwt.decode(
+                test_tokens.access_token,
+                self._public_key_obj,
+                algorithms=JWT_ALGORITHMS,
+                options=cast(Any, JWT_DECODE_OPTIONS)
+            )
+        except jwt.InvalidSignatureError:
+            # The realm key may have rotated since it was cached - fetch it
+            # again and retry once
+            self.retrieve_keycloak_public_key(force_refresh=True)
+            jwt_payload = jwt.decode(
+                test_tokens.access_token,
+                self._public_key_obj,
+                algorithms=JWT_ALGORITHMS,
+                options=cast(Any, JWT_DECODE_OPTIONS)
+            )
+
+        # Don't hand out tokens which are about to expire
+        stale_at = _stale_at(jwt_payload)
+        if stale_at is None:
+            # tokens without an expiry aren't remembered
+            return
+        if time.time() > stale_at:
+            raise ExpiredSignatureError(
+                "Token is expired or about to expire.")
+
+        _VALIDATED_TOKENS[token_key] = stale_at
+        while len(_VALIDATED_TOKENS) > VALIDATED_TOKEN_CACHE_SIZE:
+            _VALIDATED_TOKENS.popitem(last=False)
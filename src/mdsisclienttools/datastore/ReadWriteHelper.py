@@ -1,13 +1,81 @@
+import sys
+import os
+import time
+import functools
+import hashlib
+import shutil
+import copy
+from contextlib import closing
+import threading
+from datetime import datetime, timezone
 import requests
-from typing import Dict, Any, Optional, List
-import cloudpathlib.s3 as s3  # type: ignore
-from mdsisclienttools.auth.TokenManager import BearerAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, List, Tuple, Callable
+# orjson backed when installed
+from mdsisclienttools.auth.TokenManager import BearerAuth, _json_loads
 
 
 DEFAULT_DATA_STORE_ENDPOINT = "https://data-api.mds.gbrrestoration.org"
 
+# Upper bound on simultaneous data store API requests - kept below the
+# session pool size so concurrent calls never wait on a free connection
+MAX_CONCURRENT_REQUESTS = 10
+
+# S3 transfer settings - objects larger than S3_MULTIPART_SIZE are
+# transferred as concurrent ranged parts of that size
+S3_MULTIPART_SIZE = 8 * 1024 * 1024
+S3_MAX_CONCURRENCY = 16
+
+# Number of files transferred at once, and the attempts made at each file
+# with a base delay (s) between them which doubles after each failure
+S3_MAX_WORKERS = 16
+S3_TRANSFER_ATTEMPTS = 3
+S3_TRANSFER_BACKOFF = 0.5
+
+# How long (s) a fetched dataset item is reused before it is fetched again,
+# and the most items kept at once
+DATASET_CACHE_TTL = 60
+DATASET_CACHE_SIZE = 256
+
+# (endpoint, handle ID, sha256 of access token) -> (time.monotonic() when
+# fetched, dataset item). Hashes are kept so the cache doesn't hold on to
+# the tokens themselves.
+_DATASET_CACHE: Dict[Tuple[str, str, bytes], Tuple[float, Dict[str, Any]]] = {}
+_DATASET_CACHE_LOCK = threading.Lock()
+
+# Cached AWS credentials are not used within this many seconds of expiry,
+# and the most credentials kept at once
+CREDENTIAL_EXPIRY_MARGIN = 30
+CREDENTIAL_CACHE_SIZE = 256
+
+# (credential endpoint, handle ID, sha256 of access token) -> (unix expiry
+# time, AWS credentials)
+_CREDENTIAL_CACHE: Dict[Tuple[str, str, bytes], Tuple[float, Dict[str, Any]]] = {}
+_CREDENTIAL_CACHE_LOCK = threading.Lock()
+
+# Shared session so that consecutive data store API calls reuse pooled
+# keep-alive connections instead of performing a new TLS handshake each time.
+# Connection errors, throttling and transient server errors are retried with
+# exponential backoff so a blip doesn't abort an upload or download. Once
+# retries run out the final response is returned rather than raising
+# RetryError, so permanent failures reach the existing status checks.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False
+    )
+))
+
 
-def _fetch_all_datasets(auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> List[Dict[str, Any]]:
+def _fetch_all_datasets(auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
     """    fetch_datasets
         Given basic bearer auth will call the fetch 
         datasets API endpoint to find an example dataset. 
@@ -16,6 +84,8 @@ def _fetch_all_datasets(auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_END
         ----------
         auth : BearerAuth
             The bearer auth object 
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
 
         Returns
         -------
@@ -29,22 +99,23 @@ def _fetch_all_datasets(auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_END
         --------
     """
     _endpoint = endpoint + "/registry/items/list-all-datasets"
-    response = requests.get(_endpoint, auth=auth)
+    response = (session or _SESSION).get(_endpoint, auth=auth)
 
     # Check successful
     assert response.status_code == 200
-    response = response.json()
+    response = _json_loads(response.content)
     assert response['status']['success']
 
     # Return the items
     return response['registry_items']
 
 
-def _fetch_dataset(handle_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> Optional[Dict[str, Any]]:
+def _fetch_dataset(handle_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> Optional[Dict[str, Any]]:
     """ _fetch_dataset
         Given the handle ID to lookup and the basic auth will 
         call the fetch dataset data store API to get more 
-        information about the dataset.
+        information about the dataset. Found items are reused for 
+        DATASET_CACHE_TTL seconds.
 
         Arguments
         ----------
@@ -52,6 +123,8 @@ def _fetch_dataset(handle_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DAT
             The handle ID to lookup
         auth : BearerAuth
             The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
 
         Returns
         -------
@@ -69,29 +142,170 @@ def _fetch_dataset(handle_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DAT
         Examples (optional)
         --------
     """
+    cache_key = (endpoint, handle_id,
+                 hashlib.sha256(auth.token.encode()).digest())
+    with _DATASET_CACHE_LOCK:
+        cached = _DATASET_CACHE.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < DATASET_CACHE_TTL:
+        # copied so callers can't change the cached item
+        return copy.deepcopy(cached[1])
+
     fetch_endpoint = endpoint + "/registry/items/fetch-dataset"
     params = {
         'handle_id': handle_id
     }
-    response = requests.get(fetch_endpoint, params=params, auth=auth)
+    response = (session or _SESSION).get(fetch_endpoint, params=params, auth=auth)
 
     # Check successful
     try:
         assert response.status_code == 200
-        assert response.json()['status']['success']
+        body = _json_loads(response.content)
+        assert body['status']['success']
 
         # Return the items
-        return response.json()['item']
+        item: Dict[str, Any] = body['item']
     except Exception as e:
         if (response.status_code == 200):
             return None
         else:
             raise e
 
+    # only found items are cached so a missing dataset is looked up again
+    now = time.monotonic()
+    with _DATASET_CACHE_LOCK:
+        for key in [key for key, (fetched, _) in _DATASET_CACHE.items()
+                    if now - fetched >= DATASET_CACHE_TTL]:
+            del _DATASET_CACHE[key]
+        _DATASET_CACHE.pop(cache_key, None)
+        while len(_DATASET_CACHE) >= DATASET_CACHE_SIZE:
+            # oldest first
+            del _DATASET_CACHE[next(iter(_DATASET_CACHE))]
+        _DATASET_CACHE[cache_key] = (now, copy.deepcopy(item))
+    return item
+
+
+def _fetch_datasets(handle_ids: List[str], auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """ _fetch_datasets
+        Looks up several datasets with a single list all datasets call
+        rather than one fetch dataset call per handle. Use _fetch_dataset
+        for a single handle.
+
+        Arguments
+        ----------
+        handle_ids : List[str]
+            The handle IDs to lookup
+        auth : BearerAuth
+            The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
+
+        Returns
+        -------
+         : Dict[str, Optional[Dict[str, Any]]]
+            The item for each handle ID, or None if it was not found
+
+        See Also (optional)
+        --------
+
+        Examples (optional)
+        --------
+    """
+    if not handle_ids:
+        return {}
+
+    items = {
+        item['handle']: item for item in _fetch_all_datasets(
+            auth=auth, endpoint=endpoint, session=session)
+    }
+    return {handle_id: items.get(handle_id) for handle_id in handle_ids}
+
+
+def _expiry_timestamp(expiry: Any) -> Optional[float]:
+    """    _expiry_timestamp
+        Converts the ISO 8601 expiry of AWS credentials to a unix 
+        timestamp. Expiries without a timezone are taken to be UTC.
+
+        Arguments
+        ----------
+        expiry : Any
+            The expiry attribute of the credentials
+
+        Returns
+        -------
+         : Optional[float]
+            The timestamp or None if the expiry could not be parsed
+    """
+    try:
+        # fromisoformat only accepts a Z suffix from python 3.11
+        parsed = datetime.fromisoformat(str(expiry).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _generate_credentials(credential_endpoint: str, dataset_id: str, auth: BearerAuth, session: Optional[requests.Session] = None) -> Dict[str, Any]:
+    """    _generate_credentials
+        Gets AWS credentials from the given data store API credentials
+        endpoint. Credentials are reused until CREDENTIAL_EXPIRY_MARGIN 
+        seconds before they expire.
+
+        Arguments
+        ----------
+        credential_endpoint : str
+            The full URL of the credential generation endpoint
+        dataset_id : str
+            The datasets handle ID
+        auth : BearerAuth
+            The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
+
+        Returns
+        -------
+         : Dict[str,Any]
+            AWS credentials - a copy which the caller may modify
+    """
+    cache_key = (credential_endpoint, dataset_id,
+                 hashlib.sha256(auth.token.encode()).digest())
+    with _CREDENTIAL_CACHE_LOCK:
+        cached = _CREDENTIAL_CACHE.get(cache_key)
+    if cached is not None and time.time() + CREDENTIAL_EXPIRY_MARGIN < cached[0]:
+        return dict(cached[1])
+
+    response = (session or _SESSION).post(credential_endpoint, json={
+        "dataset_id": dataset_id,
+        "console_session_required": False
+    }, auth=auth)
+
+    # Check successful
+    assert response.status_code == 200, f"Expected response 200OK but got {response.status_code}"
+    response = _json_loads(response.content)
+    assert response['status']['success']
+
+    creds: Dict[str, Any] = response['credentials']
+    expiry = _expiry_timestamp(creds.get('expiry'))
+    usable_until = time.time() + CREDENTIAL_EXPIRY_MARGIN
+    if expiry is not None and expiry > usable_until:
+        with _CREDENTIAL_CACHE_LOCK:
+            for key in [key for key, (expires, _) in _CREDENTIAL_CACHE.items()
+                        if expires <= usable_until]:
+                del _CREDENTIAL_CACHE[key]
+            _CREDENTIAL_CACHE.pop(cache_key, None)
+            while len(_CREDENTIAL_CACHE) >= CREDENTIAL_CACHE_SIZE:
+                # oldest first
+                del _CREDENTIAL_CACHE[next(iter(_CREDENTIAL_CACHE))]
+            _CREDENTIAL_CACHE[cache_key] = (expiry, dict(creds))
+
+    # Give back AWS creds
+    return creds
+
 
-def _read_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> Dict[str, Any]:
+def _read_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     """    read_dataset
-        Gets AWS read credentials using the data store API.
+        Gets AWS read credentials using the data store API. See
+        _generate_credentials.
 
         Arguments
         ----------
@@ -99,6 +313,8 @@ def _read_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DAT
             The datasets handle ID
         auth : BearerAuth
             The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
 
         Returns
         -------
@@ -113,23 +329,54 @@ def _read_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DAT
     """
     read_cred_endpoint = endpoint + \
         "/registry/credentials/generate-read-access-credentials"
-    response = requests.post(read_cred_endpoint, json={
-        "dataset_id": dataset_id,
-        "console_session_required": False
-    }, auth=auth)
+    return _generate_credentials(read_cred_endpoint, dataset_id, auth=auth, session=session)
 
-    # Check successful
-    assert response.status_code == 200
-    response = response.json()
-    assert response['status']['success']
 
-    # Give back AWS creds
-    return response['credentials']
+def _read_datasets(dataset_ids: List[str], auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> Dict[str, Dict[str, Any]]:
+    """    _read_datasets
+        Gets AWS read credentials for several datasets using the data
+        store API. Duplicate handles are only requested once and the
+        requests are issued concurrently over the shared session so the
+        total wait is roughly one round trip rather than one per dataset.
+
+        Arguments
+        ----------
+        dataset_ids : List[str]
+            The handle IDs of the datasets
+        auth : BearerAuth
+            The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
+
+        Returns
+        -------
+         : Dict[str, Dict[str,Any]]
+            AWS credentials keyed by dataset handle ID
 
+        See Also (optional)
+        --------
+
+        Examples (optional)
+        --------
+    """
+    # dict.fromkeys de-duplicates while keeping the input order
+    unique_ids = list(dict.fromkeys(dataset_ids))
+    if not unique_ids:
+        return {}
 
-def _write_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> Dict[str, Any]:
+    with ThreadPoolExecutor(max_workers=min(len(unique_ids), MAX_CONCURRENT_REQUESTS)) as executor:
+        creds = executor.map(
+            lambda dataset_id: _read_dataset(
+                dataset_id, auth=auth, endpoint=endpoint, session=session),
+            unique_ids
+        )
+        return dict(zip(unique_ids, creds))
+
+
+def _write_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     """  _write_dataset
-        Gets AWS write credentials using the data store API.
+        Gets AWS write credentials using the data store API. See
+        _generate_credentials.
 
         Arguments
         ----------
@@ -137,6 +384,8 @@ def _write_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DA
             The datasets handle ID
         auth : BearerAuth
             The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the request with, by default the shared session
 
         See Also (optional)
         --------
@@ -146,19 +395,7 @@ def _write_dataset(dataset_id: str, auth: BearerAuth, endpoint: str = DEFAULT_DA
     """
     write_credential_endpoint = endpoint + \
         "/registry/credentials/generate-write-access-credentials"
-    response = requests.post(write_credential_endpoint,
-                             json={
-                                 "dataset_id": dataset_id,
-                                 "console_session_required": False
-                             }, auth=auth)
-
-    # Check successful
-    assert response.status_code == 200, f"Expected response 200OK but got {response.status_code}"
-    response = response.json()
-    assert response['status']['success']
-
-    # Give back AWS creds
-    return response['credentials']
+    return _generate_credentials(write_credential_endpoint, dataset_id, auth=auth, session=session)
 
 
 def print_creds(creds: Dict[str, Any]) -> None:
@@ -177,13 +414,9 @@ def print_creds(creds: Dict[str, Any]) -> None:
         Examples (optional)
         --------
     """
-    def transform(
-        name: str, val: str) -> str: return f"export {name.upper()}=\"{val}\""
-    item_list = []
-    for key, val in creds.items():
-        if (key != "expiry"):
-            item_list.append(transform(key, val))
-    print('\n'.join(item_list))
+    sys.stdout.write('\n'.join(
+        f"export {key.upper()}=\"{val}\"" for key, val in creds.items() if key != "expiry"
+    ) + '\n')
 
 
 def print_command_suggestion(s3_loc: Dict[str, Any]) -> None:
@@ -205,11 +438,179 @@ def print_command_suggestion(s3_loc: Dict[str, Any]) -> None:
         f"To view: aws s3 ls {s3_loc['s3_uri']}\nTo download (into folder 'data'): aws s3 sync {s3_loc['s3_uri']} data/")
 
 
+def _s3_client(s3_creds: Dict[str, Any]) -> Any:
+    """    _s3_client
+        Creates a boto3 S3 client from the AWS creds with a connection
+        pool large enough for S3_MAX_WORKERS concurrent transfers of
+        S3_MAX_CONCURRENCY parts each.
+
+        Arguments
+        ----------
+        s3_creds : Dict[str, Any]
+            S3 creds which match input format (i.e. expiry attribute dropped)
+
+        Returns
+        -------
+         : S3.Client
+            The boto3 S3 client
+    """
+    # boto3 is slow to import and only needed for the transfer itself, so
+    # it is imported here rather than at module level
+    import boto3  # type: ignore
+    from botocore.config import Config  # type: ignore
+
+    return boto3.session.Session(**s3_creds).client("s3", config=Config(
+        max_pool_connections=S3_MAX_WORKERS * S3_MAX_CONCURRENCY
+    ))
+
+
+def _s3_transfer_config() -> Any:
+    """    _s3_transfer_config
+        The boto3 transfer settings used for each object - objects larger 
+        than S3_MULTIPART_SIZE are transferred as concurrent multipart 
+        chunks.
+
+        Returns
+        -------
+         : TransferConfig
+            The boto3 transfer config
+    """
+    from boto3.s3.transfer import TransferConfig  # type: ignore
+
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_SIZE,
+        multipart_chunksize=S3_MULTIPART_SIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        use_threads=True
+    )
+
+
+def _split_s3_uri(s3_uri: str) -> Tuple[str, str]:
+    """    _split_s3_uri
+        Splits an s3://bucket/prefix URI into the bucket and the key 
+        prefix. A non empty prefix is given a trailing / so that it only
+        matches keys inside that folder.
+
+        Arguments
+        ----------
+        s3_uri : str
+            The S3 URI
+
+        Returns
+        -------
+         : Tuple[str, str]
+            The bucket and key prefix
+    """
+    bucket, _, prefix = s3_uri[len("s3://"):].partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return bucket, prefix
+
+
+def _run_transfers(transfers: Dict[str, Callable[[], Any]]) -> None:
+    """    _run_transfers
+        Runs the S3 transfer calls concurrently on up to S3_MAX_WORKERS 
+        threads. Each call is retried up to S3_TRANSFER_ATTEMPTS times 
+        with exponential backoff.
+
+        Arguments
+        ----------
+        transfers : Dict[str, Callable[[], Any]]
+            The transfer calls keyed by the S3 key they transfer
+
+        Raises
+        ------
+        Exception
+            If any transfer still fails after retrying, once all 
+            transfers have finished.
+    """
+    def transfer(func: Callable[[], Any]) -> None:
+        for attempt in range(S3_TRANSFER_ATTEMPTS):
+            try:
+                func()
+                return
+            except Exception:
+                if attempt == S3_TRANSFER_ATTEMPTS - 1:
+                    raise
+                time.sleep(S3_TRANSFER_BACKOFF * 2 ** attempt)
+
+    if not transfers:
+        return
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=min(len(transfers), S3_MAX_WORKERS)) as executor:
+        futures = {
+            executor.submit(transfer, func): key for key, func in transfers.items()
+        }
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                failures.append(f"{futures[future]}: {error}")
+
+    if failures:
+        raise Exception(
+            f"{len(failures)} of {len(transfers)} file transfers failed. Errors: {failures}")
+
+
+def _download_object(client: Any, bucket: str, key: str, local_path: str) -> None:
+    """    _download_object
+        Downloads a single object with one GET request. Used for objects
+        below S3_MULTIPART_SIZE.
+
+        Arguments
+        ----------
+        client : S3.Client
+            The boto3 S3 client
+        bucket : str
+            The bucket name
+        key : str
+            The object key
+        local_path : str
+            The file to write the object to
+    """
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    with open(local_path, "wb") as f:
+        shutil.copyfileobj(body, f)
+
+
+def _destination_path(destination_dir: str, relative_key: str) -> str:
+    """    _destination_path
+        Gives the local path an object is downloaded to. Keys which 
+        would resolve outside the destination directory (e.g. through 
+        .. segments) are rejected.
+
+        Arguments
+        ----------
+        destination_dir : str
+            The download destination directory
+        relative_key : str
+            The object key relative to the dataset prefix
+
+        Returns
+        -------
+         : str
+            The local file path
+
+        Raises
+        ------
+        ValueError
+            If the path falls outside the destination directory
+    """
+    root = os.path.realpath(destination_dir)
+    local_path = os.path.realpath(
+        os.path.join(root, *relative_key.split("/")))
+    if os.path.commonpath([root, local_path]) != root or local_path == root:
+        raise ValueError(
+            f"Refusing to download object {relative_key} outside of {destination_dir}.")
+    return local_path
+
+
 def _download_files(s3_loc: Dict[str, str], s3_creds: Dict[str, Any], destination_dir: str) -> None:
     """    download_files
-        Uses the cloudpathlib library to download all the files and sub dirs/files from 
-        the specified s3 location (s3_uri in s3_loc) into the specified destination 
-        directory.
+        Downloads all the files and sub dirs/files from the specified s3 
+        location (s3_uri in s3_loc) into the specified destination 
+        directory. The objects are listed once and then downloaded 
+        concurrently.
 
         Arguments
         ----------
@@ -226,30 +627,149 @@ def _download_files(s3_loc: Dict[str, str], s3_creds: Dict[str, Any], destinatio
         Examples (optional)
         --------
     """
-    # create client
-    client = s3.S3Client(
-        **s3_creds
-    )
-    # create path
-    path = s3.S3Path(cloud_path=s3_loc['s3_uri'], client=client)
-    # download
-    path.download_to(destination_dir)
-    #Release file handles
-    path.__del__
+    # the client is closed afterwards so its pooled connections are
+    # released straight away rather than when it is garbage collected
+    with closing(_s3_client(s3_creds)) as client:
+        config = _s3_transfer_config()
+        bucket, prefix = _split_s3_uri(s3_loc['s3_uri'])
+
+        transfers: Dict[str, Callable[[], Any]] = {}
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                # skip folder placeholder objects
+                if key.endswith("/"):
+                    continue
+                local_path = _destination_path(destination_dir, key[len(prefix):])
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                if obj["Size"] < S3_MULTIPART_SIZE:
+                    # size is already known from the listing - skip the head
+                    # request download_file makes before a single part GET
+                    transfers[key] = functools.partial(
+                        _download_object, client, bucket, key, local_path)
+                else:
+                    transfers[key] = functools.partial(
+                        client.download_file, bucket, key, local_path, Config=config)
+
+        os.makedirs(destination_dir, exist_ok=True)
+        _run_transfers(transfers)
 
 
 def _upload_files(s3_loc: Dict[str, str], s3_creds: Dict[str, Any], source_dir: str) -> None:
-    # create client
-    client = s3.S3Client(**s3_creds)
-    # create path
-    path = s3.S3Path(cloud_path=s3_loc['s3_uri'], client=client)
-    # download
-    path.upload_from(source_dir)
-    #Release file handles
-    path.__del__
+    """    upload_files
+        Uploads all the files and sub dirs/files in the source directory 
+        to the specified s3 location (s3_uri in s3_loc), keeping their 
+        relative paths. The files are uploaded concurrently.
+
+        Arguments
+        ----------
+        s3_loc : Dict[str, str]
+            S3 location object
+        s3_creds : Dict[str, Any]
+            S3 creds which match input format (i.e. expiry attribute dropped)
+        source_dir : str
+            The directory of files to upload, or a single file which is 
+            uploaded into the s3 location
+
+        Raises
+        ------
+        FileNotFoundError
+            If source_dir does not exist
+    """
+    # os.walk silently yields nothing for a missing directory
+    if not os.path.exists(source_dir):
+        raise FileNotFoundError(
+            f"Cannot upload {source_dir} as it does not exist.")
+
+    # closed afterwards, see _download_files
+    with closing(_s3_client(s3_creds)) as client:
+        config = _s3_transfer_config()
+        bucket, prefix = _split_s3_uri(s3_loc['s3_uri'])
+
+        transfers: Dict[str, Callable[[], Any]] = {}
+        if os.path.isfile(source_dir):
+            # a single file is uploaded into the dataset folder
+            key = prefix + os.path.basename(source_dir)
+            transfers[key] = functools.partial(
+                client.upload_file, source_dir, bucket, key, Config=config)
+        for root, _, files in os.walk(source_dir):
+            for name in files:
+                local_path = os.path.join(root, name)
+                key = prefix + \
+                    os.path.relpath(local_path, source_dir).replace(os.sep, "/")
+                transfers[key] = functools.partial(
+                    client.upload_file, local_path, bucket, key, Config=config)
+
+        _run_transfers(transfers)
+
+
+def _fetch_dataset_with_credentials(handle: str, generate_credentials: Callable[..., Dict[str, Any]], auth: BearerAuth, endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None, speculate: bool = True) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """    _fetch_dataset_with_credentials
+        Fetches the dataset information and generates AWS credentials for 
+        it. When speculating, the credentials are requested alongside the 
+        dataset lookup rather than after it, so both cost a single round 
+        trip. If the dataset is not found the credentials request is 
+        cancelled, but one which has already started still completes and 
+        its result (or error) is discarded.
+
+        Arguments
+        ----------
+        handle : str
+            The handle ID of the dataset
+        generate_credentials : Callable[..., Dict[str, Any]]
+            _read_dataset or _write_dataset
+        auth : BearerAuth
+            The bearer token auth
+        session : Optional[requests.Session]
+            Session to send the requests with, by default the shared session
+        speculate : bool
+            Whether to request the credentials before the dataset is found, 
+            by default True. Write credentials should only be requested 
+            once the dataset is known to exist.
+
+        Returns
+        -------
+         : Tuple[Dict[str, str], Dict[str, Any]]
+            The S3 location object and the AWS credentials
+
+        Raises
+        ------
+        ValueError
+            If the dataset cannot be found.
+    """
+    if not speculate:
+        response = _fetch_dataset(
+            handle_id=handle, auth=auth, endpoint=endpoint, session=session)
+        if not response:
+            raise ValueError(
+                f'Invalid input... the dataset with that handle: {handle} could not be found.')
+        print(
+            f"Found dataset: {response['collection_format']['dataset_info']['name']}.")
+        return response['s3'], generate_credentials(
+            handle, auth=auth, endpoint=endpoint, session=session)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    creds_future = executor.submit(
+        generate_credentials, handle, auth=auth, endpoint=endpoint, session=session)
+    try:
+        response = _fetch_dataset(
+            handle_id=handle, auth=auth, endpoint=endpoint, session=session)
+
+        # Handle was not found - the credentials aren't needed
+        if not response:
+            raise ValueError(
+                f'Invalid input... the dataset with that handle: {handle} could not be found.')
+
+        print(
+            f"Found dataset: {response['collection_format']['dataset_info']['name']}.")
+        return response['s3'], creds_future.result()
+    finally:
+        # only stops the request if it hasn't started yet
+        creds_future.cancel()
+        executor.shutdown(wait=False)
 
 
-def upload(handle: str, auth: BearerAuth, source_dir: str, data_store_api_endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> None:
+def upload(handle: str, auth: BearerAuth, source_dir: str, data_store_api_endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> None:
     """Given a source path, handle and authorisation information, will
     retrieve read only credentials from the data store API, fetch the 
     dataset information, then upload all the dataset files to the 
@@ -262,30 +782,22 @@ def upload(handle: str, auth: BearerAuth, source_dir: str, data_store_api_endpoi
     auth : BearerAuth
         The bearer auth object. See TokenManager library.
     source_dir : str
-        The path of to folder of files to upload.
+        The path of to folder of files to upload, or of a single file.
+    session : Optional[requests.Session]
+        A long lived session to send the data store API requests with. By
+        default a shared module level session is used.
 
     Raises
     ------
     ValueError
         Raises a value error if the handle id is invalid.
+    FileNotFoundError
+        If the source path does not exist.
     """
-    # Get info about handle
-    response = _fetch_dataset(
-        handle_id=handle, auth=auth, endpoint=data_store_api_endpoint)
-
-    # Handle was found
-    if response:
-        s3_loc = response['s3']
-
-        print(
-            f"Found dataset: {response['collection_format']['dataset_info']['name']}.")
-    else:
-        # Handle was not found
-        raise ValueError(
-            f'Invalid input... the dataset with that handle: {handle} could not be found.')
-
-    # get write credentials for this dataset
-    creds = _write_dataset(handle, auth=auth, endpoint=data_store_api_endpoint)
+    # Get info about handle and write credentials for this dataset
+    s3_loc, creds = _fetch_dataset_with_credentials(
+        handle, _write_dataset, auth=auth, endpoint=data_store_api_endpoint,
+        session=session, speculate=False)
 
     print()
     print(f'Attempting to upload files to {source_dir}')
@@ -297,7 +809,7 @@ def upload(handle: str, auth: BearerAuth, source_dir: str, data_store_api_endpoi
     print(f"Upload complete.")
 
 
-def download(download_path: str, handle: str, auth: BearerAuth, data_store_api_endpoint: str = DEFAULT_DATA_STORE_ENDPOINT) -> None:
+def download(download_path: str, handle: str, auth: BearerAuth, data_store_api_endpoint: str = DEFAULT_DATA_STORE_ENDPOINT, session: Optional[requests.Session] = None) -> None:
     """Given a download path, handle and authorisation information, will
     retrieve read only credentials from the data store API, fetch the 
     dataset information, then download all the dataset files to the 
@@ -313,29 +825,19 @@ def download(download_path: str, handle: str, auth: BearerAuth, data_store_api_e
         The handle ID of the dataset to download.
     auth : BearerAuth
         The bearer auth object. See TokenManager library.
+    session : Optional[requests.Session]
+        A long lived session to send the data store API requests with. By
+        default a shared module level session is used.
 
     Raises
     ------
     ValueError
         Raises a value error if the dataset cannot be found.
     """
-    # Get info about handle
-    response = _fetch_dataset(
-        handle_id=handle, auth=auth, endpoint=data_store_api_endpoint)
-
-    # Handle was found
-    if response:
-        s3_loc = response['s3']
-
-        print(
-            f"Found dataset: {response['collection_format']['dataset_info']['name']}.")
-    else:
-        # Handle was not found
-        raise ValueError(
-            f'Invalid input... the dataset with that handle: {handle} could not be found.')
-
-    # get read credentials for this dataset
-    creds = _read_dataset(handle, auth=auth, endpoint=data_store_api_endpoint)
+    # Get info about handle and read credentials for this dataset
+    s3_loc, creds = _fetch_dataset_with_credentials(
+        handle, _read_dataset, auth=auth, endpoint=data_store_api_endpoint,
+        session=session)
 
     print()
     print(f'Attempting to download files to {download_path}')
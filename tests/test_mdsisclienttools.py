@@ -1,17 +1,47 @@
 import pytest
+import os
+import io
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pathlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import requests
+import jwt
+from cryptography.hazmat.primitives import serialization
 from mdsisclienttools.auth.TokenManager import BearerAuth, DeviceFlowManager
+import mdsisclienttools.auth.TokenManager as TokenManager
 import mdsisclienttools.datastore.ReadWriteHelper as IOHelper # type: ignore
 
 IOHelper.DEFAULT_DATA_STORE_ENDPOINT = "https://data.testing.rrap-is.com"
 auth_server = "https://auth.dev.rrap-is.com/auth/realms/rrap"
 
+def make_manager(**attributes: Any) -> DeviceFlowManager:
+    """Builds a DeviceFlowManager without running __init__, which would
+    contact keycloak. The given attributes are set over quiet defaults."""
+    manager = DeviceFlowManager.__new__(DeviceFlowManager)
+    defaults: Dict[str, Any] = {
+        "silent": True,
+        "keycloak_endpoint": auth_server,
+        "token_endpoint": auth_server + "/token",
+        "client_id": "client",
+        "_scope_str": "",
+        "auth_flow": TokenManager.AuthFlow.DEVICE,
+        "_file_tokens": None,
+    }
+    for name, value in {**defaults, **attributes}.items():
+        setattr(manager, name, value)
+    return manager
+
 def test_fake()->None:
     assert True
 
 # def test_fake(init_auth_token)->None:
 #     assert init_auth_token.get_auth
 
-# @pytest.fixture
+# @pytest.fixture(scope="session")
 # def init_auth_token()->DeviceFlowManager:
 #     local_token_storage = ".tokens.json"
 #     token_manager =  DeviceFlowManager(
@@ -21,8 +51,677 @@ def test_fake()->None:
 #     )
 #     return token_manager
 
-# def test_get_handle(init_auth_token)->None:
+# @pytest.mark.parametrize("handle_id", ["10378.1/1688259", "10378.1/1688092", "10378.1/1688315"])
+# def test_get_handle(init_auth_token, handle_id)->None:
 #     auth = init_auth_token.get_auth
-#     handle_id = "10378.1/1688092"
 #     IOHelper.download('./Data',handle_id,auth)
 
+
+def test_read_datasets_keyed_by_handle(monkeypatch: pytest.MonkeyPatch) -> None:
+    requested = []
+
+    session = requests.Session()
+
+    def fake_read(dataset_id: str, auth: BearerAuth, endpoint: str, session: requests.Session) -> dict:
+        requested.append(dataset_id)
+        return {"dataset_id": dataset_id, "session": session}
+
+    monkeypatch.setattr(IOHelper, "_read_dataset", fake_read)
+    handles = ["10378.1/1", "10378.1/2", "10378.1/1"]
+    creds = IOHelper._read_datasets(handles, auth=BearerAuth("token"), session=session)
+    assert list(creds) == ["10378.1/1", "10378.1/2"]
+    assert creds["10378.1/2"]["dataset_id"] == "10378.1/2"
+    assert creds["10378.1/2"]["session"] is session
+    assert sorted(requested) == ["10378.1/1", "10378.1/2"]
+
+def test_fetch_datasets_single_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+
+    def fake_fetch_all(auth: BearerAuth, endpoint: str, session: requests.Session) -> list:
+        calls.append(endpoint)
+        return [{"handle": "10378.1/1"}, {"handle": "10378.1/2"}]
+
+    monkeypatch.setattr(IOHelper, "_fetch_all_datasets", fake_fetch_all)
+    items = IOHelper._fetch_datasets(["10378.1/2", "10378.1/3"], auth=BearerAuth("token"))
+    assert items == {"10378.1/2": {"handle": "10378.1/2"}, "10378.1/3": None}
+    assert len(calls) == 1
+
+def test_fetch_dataset_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    requested = []
+
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, handle_id: str) -> None:
+            self.handle_id = handle_id
+
+        @property
+        def content(self) -> bytes:
+            found = self.handle_id == "10378.1/1"
+            return json.dumps({
+                "status": {"success": found},
+                "item": {"handle": self.handle_id} if found else None
+            }).encode()
+
+    def fake_get(url: str, params: dict, auth: BearerAuth) -> FakeResponse:
+        requested.append(params["handle_id"])
+        return FakeResponse(params["handle_id"])
+
+    monkeypatch.setattr(IOHelper._SESSION, "get", fake_get)
+    monkeypatch.setattr(IOHelper, "_DATASET_CACHE", {})
+    auth = BearerAuth("token")
+    for _ in range(2):
+        item = IOHelper._fetch_dataset("10378.1/1", auth=auth)
+        assert item == {"handle": "10378.1/1"}
+        # callers changing an item don't change the cached copy
+        item["handle"] = "changed"
+        assert IOHelper._fetch_dataset("10378.1/9", auth=auth) is None
+    assert requested == ["10378.1/1", "10378.1/9", "10378.1/9"]
+    assert "token" not in str(list(IOHelper._DATASET_CACHE))
+
+    monkeypatch.setattr(IOHelper, "DATASET_CACHE_SIZE", 1)
+    IOHelper._fetch_dataset("10378.1/1", auth=BearerAuth("other"))
+    assert len(IOHelper._DATASET_CACHE) == 1
+
+    monkeypatch.setattr(IOHelper, "DATASET_CACHE_TTL", 0)
+    IOHelper._fetch_dataset("10378.1/1", auth=auth)
+    assert requested[-1] == "10378.1/1"
+
+def test_credentials_cached_until_expiry(monkeypatch: pytest.MonkeyPatch) -> None:
+    posted = []
+    expiry = "2099-01-01T00:00:00Z"
+
+    class FakeResponse:
+        status_code = 200
+
+        @property
+        def content(self) -> bytes:
+            return json.dumps({
+                "status": {"success": True},
+                "credentials": {"aws_access_key_id": "id", "expiry": expiry}
+            }).encode()
+
+    def fake_post(url: str, json: dict, auth: BearerAuth) -> FakeResponse:
+        posted.append(json["dataset_id"])
+        return FakeResponse()
+
+    monkeypatch.setattr(IOHelper._SESSION, "post", fake_post)
+    monkeypatch.setattr(IOHelper, "_CREDENTIAL_CACHE", {})
+    auth = BearerAuth("token")
+    creds = IOHelper._read_dataset("10378.1/1", auth=auth)
+    del creds["expiry"]
+    assert IOHelper._read_dataset("10378.1/1", auth=auth)["expiry"] == expiry
+    IOHelper._write_dataset("10378.1/1", auth=auth)
+    assert len(posted) == 2
+    assert "token" not in str(list(IOHelper._CREDENTIAL_CACHE))
+
+    monkeypatch.setattr(IOHelper, "CREDENTIAL_CACHE_SIZE", 1)
+    IOHelper._read_dataset("10378.1/2", auth=auth)
+    assert len(IOHelper._CREDENTIAL_CACHE) == 1
+
+    expiry = "2000-01-01T00:00:00+00:00"
+    monkeypatch.setattr(IOHelper, "_CREDENTIAL_CACHE", {})
+    IOHelper._read_dataset("10378.1/1", auth=auth)
+    IOHelper._read_dataset("10378.1/1", auth=auth)
+    assert len(posted) == 5
+    # expired credentials aren't kept
+    assert IOHelper._CREDENTIAL_CACHE == {}
+
+def test_data_store_session_returns_final_response() -> None:
+    adapter = IOHelper._SESSION.get_adapter(IOHelper.DEFAULT_DATA_STORE_ENDPOINT)
+    assert isinstance(adapter, requests.adapters.HTTPAdapter)
+    assert adapter.max_retries.is_retry("GET", 503)
+    # exhausted retries reach the status code checks instead of raising
+    assert not adapter.max_retries.raise_on_status
+
+def test_bearer_auth_header() -> None:
+    request = requests.Request("GET", "https://example.com").prepare()
+    BearerAuth("abc")(request)
+    assert request.headers["authorization"] == "Bearer abc"
+
+def test_browser_unavailable_when_headless(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(TokenManager.sys, "platform", "linux")
+    for var in ("DISPLAY", "WAYLAND_DISPLAY", "BROWSER"):
+        monkeypatch.delenv(var, raising=False)
+    assert not TokenManager._browser_available()
+    monkeypatch.setenv("DISPLAY", ":0")
+    assert TokenManager._browser_available()
+
+def test_print_creds(capsys: pytest.CaptureFixture) -> None:
+    IOHelper.print_creds({
+        "aws_access_key_id": "id",
+        "aws_secret_access_key": "secret",
+        "expiry": "2022-01-01T00:00:00"
+    })
+    assert capsys.readouterr().out == \
+        'export AWS_ACCESS_KEY_ID="id"\nexport AWS_SECRET_ACCESS_KEY="secret"\n'
+
+def test_public_key_cached_per_endpoint(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+
+    class FakeResponse:
+        def __init__(self, status_code: int) -> None:
+            self.status_code = status_code
+            self.headers = {"ETag": "v1"}
+
+        def raise_for_status(self) -> None:
+            pass
+
+        @property
+        def content(self) -> bytes:
+            assert self.status_code == 200
+            return b'{"public_key": "abc"}'
+
+    def fake_get(url: str, headers: dict, timeout: int) -> FakeResponse:
+        calls.append(headers)
+        return FakeResponse(304 if "If-None-Match" in headers else 200)
+
+    monkeypatch.setattr(TokenManager._SESSION, "get", fake_get)
+    monkeypatch.setattr(serialization, "load_pem_public_key", lambda key: key)
+    monkeypatch.setattr(TokenManager, "_PUBLIC_KEY_CACHE", {})
+    for _ in range(2):
+        manager = make_manager(storage_type=TokenManager.StorageType.OBJECT)
+        manager.retrieve_keycloak_public_key()
+        assert manager.public_key and "abc" in manager.public_key
+    assert len(calls) == 1
+
+    # revalidated with the ETag and kept on 304
+    manager.retrieve_keycloak_public_key(force_refresh=True)
+    assert calls[1]["If-None-Match"] == "v1"
+    assert manager.public_key and "abc" in manager.public_key
+
+def test_validate_token_decodes_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    decoded = []
+
+    def fake_decode(token: str, key: str, algorithms: list, options: dict) -> dict:
+        decoded.append(token)
+        return {"exp": time.time() + 3600}
+
+    monkeypatch.setattr(jwt, "decode", fake_decode)
+    monkeypatch.setattr(TokenManager, "_VALIDATED_TOKENS", OrderedDict())
+    manager = make_manager(
+        public_key="key", _public_key_obj="key",
+        tokens=TokenManager.Tokens(access_token="abc", refresh_token=None))
+    manager.validate_token()
+    manager.validate_token()
+    # other managers of the same realm reuse the verification
+    other = make_manager()
+    other.validate_token(tokens=manager.tokens)
+    assert decoded == ["abc"]
+
+    # but a token is verified again against another realm's key
+    other.keycloak_endpoint = auth_server + "-other"
+    other.public_key = other._public_key_obj = "other key"
+    other.validate_token(tokens=manager.tokens)
+    assert decoded == ["abc", "abc"]
+
+    for token_key in TokenManager._VALIDATED_TOKENS:
+        TokenManager._VALIDATED_TOKENS[token_key] = time.time()
+    with pytest.raises(jwt.ExpiredSignatureError):
+        manager.validate_token()
+
+def test_validate_token_short_lived(monkeypatch: pytest.MonkeyPatch) -> None:
+    # a realm issuing one minute tokens - the margin is capped at half life
+    now = time.time()
+    claims = {"iat": now, "exp": now + 60}
+    monkeypatch.setattr(jwt, "decode", lambda token, key, algorithms, options: claims)
+    monkeypatch.setattr(TokenManager, "_VALIDATED_TOKENS", OrderedDict())
+    manager = make_manager(public_key="key", _public_key_obj="key")
+    token = jwt.encode(claims, "a-secret-long-enough-for-hs256-key", algorithm="HS256")
+    manager.validate_token(tokens=TokenManager.Tokens(access_token=token, refresh_token=None))
+
+    # but is still rejected past half life
+    monkeypatch.setattr(TokenManager.time, "time", lambda: now + 31)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        manager.validate_token(tokens=TokenManager.Tokens(access_token=token, refresh_token=None))
+
+def test_update_local_storage_skips_unchanged(tmp_path: pathlib.Path) -> None:
+    storage = tmp_path / "tokens.json"
+    manager = make_manager(
+        storage_type=TokenManager.StorageType.FILE,
+        token_storage_location=str(storage),
+        tokens=TokenManager.Tokens(access_token="a", refresh_token="r"))
+
+    manager.update_local_storage(TokenManager.Stage.TEST)
+    stored = TokenManager.StageTokens.parse_file(storage)
+    assert stored.stages[TokenManager.Stage.TEST] == manager.tokens
+
+    written = storage.stat()
+    manager.update_local_storage(TokenManager.Stage.TEST)
+    assert storage.stat().st_ino == written.st_ino
+
+    # changes made by another process are picked up
+    other = TokenManager.Tokens(access_token="b", refresh_token="r")
+    storage.write_text(TokenManager.StageTokens(
+        stages={TokenManager.Stage.DEV: other}).json())
+    os.utime(storage, ns=(written.st_atime_ns, written.st_mtime_ns + 1))
+    reloaded = manager._load_file_tokens()
+    assert reloaded is not None
+    assert reloaded.stages[TokenManager.Stage.DEV] == other
+
+def test_load_file_tokens_missing_or_corrupt(tmp_path: pathlib.Path) -> None:
+    storage = tmp_path / "tokens.json"
+    manager = make_manager(token_storage_location=str(storage))
+    assert manager._load_file_tokens() is None
+    storage.write_text("not json")
+    assert manager._load_file_tokens() is None
+
+def test_device_flow_polling_times_out(monkeypatch: pytest.MonkeyPatch) -> None:
+    polls = []
+
+    class FakeResponse:
+        status_code = 400
+        content = b'{"error": "authorization_pending"}'
+
+    def fake_post(url: str, data: dict, timeout: Tuple[float, float]) -> FakeResponse:
+        assert timeout == TokenManager.KEYCLOAK_REQUEST_TIMEOUT
+        polls.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(TokenManager._SESSION, "post", fake_post)
+    monkeypatch.setattr(TokenManager.time, "sleep", lambda seconds: None)
+    manager = make_manager()
+    assert manager.await_device_auth_flow_completion(
+        device_code="code", interval=5, grant_type="device", expires_in=12) is None
+    assert len(polls) == 2
+
+def test_unverified_expiry() -> None:
+    token = jwt.encode({"exp": 1234}, "a-secret-long-enough-for-hs256-key", algorithm="HS256")
+    assert TokenManager._unverified_expiry(token) == 1234
+    assert TokenManager._unverified_expiry("not-a-jwt") is None
+
+def test_parse_stage() -> None:
+    assert TokenManager._parse_stage("TEST") == TokenManager.Stage.TEST
+    with pytest.raises(ValueError):
+        TokenManager._parse_stage("UNKNOWN")
+
+def test_get_auth_reuses_bearer_auth(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(DeviceFlowManager, "validate_token", lambda self: None)
+    manager = make_manager(
+        public_key="key", _bearer_auth=None,
+        tokens=TokenManager.Tokens(access_token="a", refresh_token="r"))
+    auth = manager.get_auth()
+    assert manager.get_auth() is auth
+    manager.tokens = TokenManager.Tokens(access_token="b", refresh_token="r")
+    assert manager.get_auth().token == "b"
+
+def test_public_key_persisted_with_file_storage(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    calls = []
+
+    class FakeResponse:
+        status_code = 200
+        headers: dict = {}
+        content = b'{"public_key": "abc"}'
+
+        def raise_for_status(self) -> None:
+            pass
+
+    def fake_get(url: str, headers: dict, timeout: int) -> FakeResponse:
+        calls.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(TokenManager._SESSION, "get", fake_get)
+    monkeypatch.setattr(serialization, "load_pem_public_key", lambda key: key)
+    monkeypatch.setattr(TokenManager, "_PUBLIC_KEY_CACHE", {})
+    manager = make_manager(
+        storage_type=TokenManager.StorageType.FILE,
+        token_storage_location=str(tmp_path / "tokens.json"))
+    manager.retrieve_keycloak_public_key()
+    assert (tmp_path / "tokens.json.pubkey.json").exists()
+
+    # a new process starts with an empty in memory cache
+    TokenManager._PUBLIC_KEY_CACHE.clear()
+    manager.public_key = None
+    manager.retrieve_keycloak_public_key()
+    assert manager.public_key and "abc" in manager.public_key
+    assert len(calls) == 1
+
+def test_validate_token_refetches_rotated_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    refetched = []
+
+    def fake_decode(token: str, key: str, algorithms: list, options: dict) -> dict:
+        if key == "old":
+            raise jwt.InvalidSignatureError("Signature verification failed")
+        return {"exp": time.time() + 3600}
+
+    def fake_retrieve(self: DeviceFlowManager, force_refresh: bool = False) -> None:
+        refetched.append(force_refresh)
+        self._public_key_obj = "new"
+
+    monkeypatch.setattr(jwt, "decode", fake_decode)
+    monkeypatch.setattr(DeviceFlowManager, "retrieve_keycloak_public_key", fake_retrieve)
+    monkeypatch.setattr(TokenManager, "_VALIDATED_TOKENS", OrderedDict())
+    manager = make_manager(
+        public_key="old", _public_key_obj="old",
+        tokens=TokenManager.Tokens(access_token="abc", refresh_token=None))
+    manager.validate_token()
+    assert refetched == [True]
+
+def test_update_local_storage_object() -> None:
+    storage: dict = {}
+    manager = make_manager(
+        storage_type=TokenManager.StorageType.OBJECT, object_storage=storage,
+        tokens=TokenManager.Tokens(access_token="a", refresh_token="r"))
+    manager.update_local_storage(TokenManager.Stage.TEST)
+    assert storage["stages"]["TEST"] == {"access_token": "a", "refresh_token": "r"}
+    assert type(next(iter(storage["stages"]))) is str
+
+def test_retrieve_local_tokens_missing_from_object() -> None:
+    manager = make_manager(storage_type=TokenManager.StorageType.OBJECT)
+    storages: Tuple[Dict[str, Any], ...] = ({}, {"stages": {"DEV": None}})
+    for storage in storages:
+        manager.object_storage = storage
+        assert manager.retrieve_local_tokens(TokenManager.Stage.TEST) is None
+
+def test_keycloak_session_retries() -> None:
+    adapter = TokenManager._SESSION.get_adapter(auth_server)
+    assert isinstance(adapter, requests.adapters.HTTPAdapter)
+    retry = adapter.max_retries
+    assert retry.is_retry("GET", 503)
+    # token grants are never replayed after a server or read error
+    assert not retry.is_retry("POST", 503)
+    assert retry.allowed_methods == frozenset({"GET"})
+    assert not retry.raise_on_status
+
+def test_token_refresh_not_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    # connection errors are retried by the session alone - the refresh
+    # token is posted once per refresh
+    attempts = []
+
+    def failing_refresh(self: DeviceFlowManager) -> dict:
+        attempts.append(True)
+        raise requests.ConnectionError()
+
+    monkeypatch.setattr(DeviceFlowManager, "perform_refresh", failing_refresh)
+    manager = make_manager(
+        stage=TokenManager.Stage.TEST,
+        tokens=TokenManager.Tokens(access_token="a", refresh_token="r"))
+    with pytest.raises(requests.ConnectionError):
+        manager.perform_token_refresh()
+    assert len(attempts) == 1
+
+def test_offline_flow_skips_storage(tmp_path: pathlib.Path) -> None:
+    storage = tmp_path / "tokens.json"
+    manager = make_manager(
+        storage_type=TokenManager.StorageType.FILE,
+        token_storage_location=str(storage),
+        auth_flow=TokenManager.AuthFlow.OFFLINE,
+        tokens=TokenManager.Tokens(access_token="a", refresh_token="r"))
+    manager.update_local_storage(TokenManager.Stage.TEST)
+    assert not storage.exists()
+    assert manager.tokens.refresh_token == "r"
+    assert manager.retrieve_local_tokens(TokenManager.Stage.TEST) is None
+
+def test_download_and_upload_files(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    transferred = []
+    single_gets = []
+    closed = []
+
+    class FakePaginator:
+        def paginate(self, Bucket: str, Prefix: str) -> list:
+            assert (Bucket, Prefix) == ("bucket", "datasets/1/")
+            return [
+                {"Contents": [
+                    {"Key": "datasets/1/a.txt", "Size": 16},
+                    {"Key": "datasets/1/sub/", "Size": 0}
+                ]},
+                {"Contents": [{"Key": "datasets/1/sub/b.txt", "Size": IOHelper.S3_MULTIPART_SIZE}]}
+            ]
+
+    class FakeClient:
+        def close(self) -> None:
+            closed.append(True)
+
+        def get_paginator(self, name: str) -> FakePaginator:
+            return FakePaginator()
+
+        def get_object(self, Bucket: str, Key: str) -> dict:
+            single_gets.append(Key)
+            return {"Body": io.BytesIO(Key.encode())}
+
+        def download_file(self, bucket: str, key: str, path: str, Config: Any) -> None:
+            assert Config.max_concurrency == IOHelper.S3_MAX_CONCURRENCY
+            pathlib.Path(path).write_text(key)
+
+        def upload_file(self, path: str, bucket: str, key: str, Config: Any) -> None:
+            transferred.append((pathlib.Path(path).read_text(), key))
+
+    monkeypatch.setattr(IOHelper, "_s3_client", lambda creds: FakeClient())
+    s3_loc = {"s3_uri": "s3://bucket/datasets/1"}
+    IOHelper._download_files(s3_loc, {}, str(tmp_path / "data"))
+    assert (tmp_path / "data" / "a.txt").read_text() == "datasets/1/a.txt"
+    assert single_gets == ["datasets/1/a.txt"]
+    assert closed == [True]
+    assert (tmp_path / "data" / "sub" / "b.txt").read_text() == "datasets/1/sub/b.txt"
+
+    IOHelper._upload_files({"s3_uri": "s3://bucket/datasets/2/"}, {}, str(tmp_path / "data"))
+    assert sorted(transferred) == [
+        ("datasets/1/a.txt", "datasets/2/a.txt"),
+        ("datasets/1/sub/b.txt", "datasets/2/sub/b.txt")
+    ]
+
+def test_run_transfers_reports_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    attempts = []
+
+    def failing() -> None:
+        attempts.append(True)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(IOHelper.time, "sleep", lambda seconds: None)
+    with pytest.raises(Exception, match="1 of 2 file transfers failed"):
+        IOHelper._run_transfers({"ok": lambda: None, "bad": failing})
+    assert len(attempts) == IOHelper.S3_TRANSFER_ATTEMPTS
+
+def test_fetch_dataset_with_credentials(monkeypatch: pytest.MonkeyPatch) -> None:
+    item = {"s3": {"s3_uri": "s3://bucket/1/"}, "collection_format": {"dataset_info": {"name": "one"}}}
+    monkeypatch.setattr(IOHelper, "_fetch_dataset", lambda handle_id, auth, endpoint, session: item)
+
+    def fake_creds(handle: str, auth: BearerAuth, endpoint: str, session: requests.Session) -> dict:
+        assert handle == "10378.1/1"
+        return {"aws_access_key_id": "id"}
+
+    s3_loc, creds = IOHelper._fetch_dataset_with_credentials(
+        "10378.1/1", fake_creds, auth=BearerAuth("token"))
+    assert s3_loc == item["s3"]
+    assert creds == {"aws_access_key_id": "id"}
+
+    def failing_creds(handle: str, auth: BearerAuth, endpoint: str, session: requests.Session) -> dict:
+        raise AssertionError()
+
+    monkeypatch.setattr(IOHelper, "_fetch_dataset", lambda handle_id, auth, endpoint, session: None)
+    with pytest.raises(ValueError):
+        IOHelper._fetch_dataset_with_credentials("10378.1/1", failing_creds, auth=BearerAuth("token"))
+
+    # without speculation no credentials are requested for a missing dataset
+    requested = []
+
+    def recorded_creds(handle: str, auth: BearerAuth, endpoint: str, session: requests.Session) -> dict:
+        requested.append(handle)
+        return {"aws_access_key_id": "id"}
+
+    with pytest.raises(ValueError):
+        IOHelper._fetch_dataset_with_credentials(
+            "10378.1/1", recorded_creds, auth=BearerAuth("token"), speculate=False)
+    assert requested == []
+
+    monkeypatch.setattr(IOHelper, "_fetch_dataset", lambda handle_id, auth, endpoint, session: item)
+    assert IOHelper._fetch_dataset_with_credentials(
+        "10378.1/1", recorded_creds, auth=BearerAuth("token"), speculate=False) == (item["s3"], {"aws_access_key_id": "id"})
+    assert requested == ["10378.1/1"]
+
+def patch_offline_refresh(monkeypatch: pytest.MonkeyPatch, expires_in: int = 3600) -> List[str]:
+    """Replaces the offline token exchange with one issuing tokens that
+    expire in expires_in seconds, and empties the exchanged token cache.
+    Returns the offline tokens exchanged."""
+    exchanges: List[str] = []
+
+    def fake_offline_refresh(self: DeviceFlowManager) -> dict:
+        assert self.offline_token is not None
+        exchanges.append(self.offline_token)
+        return {"access_token": f"a{len(exchanges)}", "refresh_token": "r", "expires_in": expires_in}
+
+    monkeypatch.setattr(DeviceFlowManager, "perform_offline_refresh", fake_offline_refresh)
+    monkeypatch.setattr(TokenManager, "_OFFLINE_TOKENS", {})
+    return exchanges
+
+def test_offline_exchange_shared_between_managers(monkeypatch: pytest.MonkeyPatch) -> None:
+    exchanges = patch_offline_refresh(monkeypatch)
+    first = make_manager(offline_token="offline")._exchange_offline_token()
+    assert make_manager(offline_token="offline")._exchange_offline_token() is first
+    assert make_manager(offline_token="other")._exchange_offline_token().access_token == "a2"
+    assert exchanges == ["offline", "other"]
+    replace_at = next(iter(TokenManager._OFFLINE_TOKENS.values()))[1]
+    assert replace_at == pytest.approx(time.time() + 3600 - TokenManager.TOKEN_EXPIRY_MARGIN, abs=5)
+
+def test_offline_exchange_short_lived_replaced_at_half_life(monkeypatch: pytest.MonkeyPatch) -> None:
+    patch_offline_refresh(monkeypatch, expires_in=300)
+    make_manager(offline_token="offline")._exchange_offline_token()
+    replace_at = next(iter(TokenManager._OFFLINE_TOKENS.values()))[1]
+    assert replace_at == pytest.approx(time.time() + 150, abs=5)
+
+def test_offline_exchange_stale_tokens_exchanged_again(monkeypatch: pytest.MonkeyPatch) -> None:
+    exchanges = patch_offline_refresh(monkeypatch)
+    make_manager(offline_token="offline")._exchange_offline_token()
+    cache_key, (tokens, _) = next(iter(TokenManager._OFFLINE_TOKENS.items()))
+    TokenManager._OFFLINE_TOKENS[cache_key] = (tokens, time.time())
+    assert TokenManager._cached_offline_tokens(cache_key) is None
+    assert TokenManager._OFFLINE_TOKENS == {}
+    make_manager(offline_token="offline")._exchange_offline_token()
+    assert len(exchanges) == 2
+
+def test_offline_exchange_stale_removal_keeps_newer_tokens(monkeypatch: pytest.MonkeyPatch) -> None:
+    patch_offline_refresh(monkeypatch)
+    make_manager(offline_token="offline")._exchange_offline_token()
+    cache_key, (tokens, _) = next(iter(TokenManager._OFFLINE_TOKENS.items()))
+    # tokens exchanged by another thread after the stale lookup are kept
+    fresh = (tokens, time.time() + 3600)
+
+    class RacingDict(dict):
+        def get(self, key: Any, default: Any = None) -> Any:
+            value = super().get(key, default)
+            self[key] = fresh
+            return value
+
+    racing = RacingDict({cache_key: (tokens, time.time())})
+    monkeypatch.setattr(TokenManager, "_OFFLINE_TOKENS", racing)
+    assert TokenManager._cached_offline_tokens(cache_key) is None
+    assert racing[cache_key] is fresh
+
+def test_offline_exchange_trusts_exp_claim(monkeypatch: pytest.MonkeyPatch) -> None:
+    exchanges = patch_offline_refresh(monkeypatch, expires_in=0)
+    monkeypatch.setattr(TokenManager, "_unverified_expiry", lambda token: time.time() + 3600)
+    make_manager(offline_token="offline")._exchange_offline_token()
+    make_manager(offline_token="offline")._exchange_offline_token()
+    assert len(exchanges) == 1
+
+def test_offline_exchange_once_for_concurrent_managers(monkeypatch: pytest.MonkeyPatch) -> None:
+    exchanges = []
+    barrier = threading.Barrier(4)
+
+    def slow_offline_refresh(self: DeviceFlowManager) -> dict:
+        exchanges.append(True)
+        time.sleep(0.05)
+        return {"access_token": "a", "refresh_token": "r", "expires_in": 300}
+
+    def exchange() -> str:
+        manager = make_manager(offline_token="offline")
+        barrier.wait()
+        return manager._exchange_offline_token().access_token
+
+    monkeypatch.setattr(DeviceFlowManager, "perform_offline_refresh", slow_offline_refresh)
+    monkeypatch.setattr(TokenManager, "_OFFLINE_TOKENS", {})
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: exchange(), range(4)))
+    assert results == ["a"] * 4
+    assert len(exchanges) == 1
+
+def test_offline_exchanges_of_different_tokens_concurrent(monkeypatch: pytest.MonkeyPatch) -> None:
+    started = threading.Event()
+    released = threading.Event()
+
+    def offline_refresh(self: DeviceFlowManager) -> dict:
+        if self.offline_token == "slow":
+            started.set()
+            # only released by the exchange of the other offline token
+            assert released.wait(5)
+        else:
+            released.set()
+        return {"access_token": self.offline_token, "refresh_token": "r", "expires_in": 300}
+
+    def exchange(offline_token: str) -> str:
+        return make_manager(offline_token=offline_token)._exchange_offline_token().access_token
+
+    monkeypatch.setattr(DeviceFlowManager, "perform_offline_refresh", offline_refresh)
+    monkeypatch.setattr(TokenManager, "_OFFLINE_TOKENS", {})
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow = executor.submit(exchange, "slow")
+        assert started.wait(5)
+        assert exchange("fast") == "fast"
+        assert slow.result() == "slow"
+    assert TokenManager._OFFLINE_EXCHANGE_LOCKS == {}
+
+def test_refresh_body_pre_encoded(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent = []
+
+    class FakeResponse:
+        status_code = 200
+        content = b'{"access_token": "a"}'
+
+    def fake_post(url: str, data: str, headers: dict, timeout: Tuple[float, float]) -> FakeResponse:
+        assert timeout == TokenManager.KEYCLOAK_REQUEST_TIMEOUT
+        sent.append(requests.Request("POST", url, data=data, headers=headers).prepare())
+        return FakeResponse()
+
+    monkeypatch.setattr(TokenManager._SESSION, "post", fake_post)
+    manager = make_manager(
+        _scope_str="openid email",
+        _refresh_body_prefix=TokenManager.urlencode({
+            "grant_type": "refresh_token", "client_id": "client", "scope": "openid email"
+        }) + "&refresh_token=")
+    assert manager.perform_refresh(TokenManager.Tokens(access_token="a", refresh_token="r+/=")) == {"access_token": "a"}
+
+    expected = requests.Request("POST", manager.token_endpoint, data={
+        "grant_type": "refresh_token", "client_id": "client",
+        "scope": "openid email", "refresh_token": "r+/="
+    }).prepare()
+    assert sent[0].body == expected.body
+    assert sent[0].headers["Content-Type"] == expected.headers["Content-Type"]
+
+def test_write_file_atomic_concurrent_writers(tmp_path: pathlib.Path) -> None:
+    location = str(tmp_path / "tokens.json")
+
+    def write(i: int) -> None:
+        for _ in range(50):
+            TokenManager._write_file_atomic(location, str(i).encode())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(write, range(4)))
+    assert (tmp_path / "tokens.json").read_text() in {"0", "1", "2", "3"}
+    assert [p.name for p in tmp_path.iterdir()] == ["tokens.json"]
+
+def test_destination_path_stays_in_destination(tmp_path: pathlib.Path) -> None:
+    destination = str(tmp_path / "data")
+    assert IOHelper._destination_path(destination, "sub/a.txt") == \
+        os.path.join(os.path.realpath(destination), "sub", "a.txt")
+    for key in ("../../escaped.txt", "sub/../../escaped.txt", ".."):
+        with pytest.raises(ValueError):
+            IOHelper._destination_path(destination, key)
+
+def test_upload_single_file_or_missing(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    uploaded = []
+
+    class FakeClient:
+        def close(self) -> None:
+            pass
+
+        def upload_file(self, path: str, bucket: str, key: str, Config: Any) -> None:
+            uploaded.append((path, bucket, key))
+
+    monkeypatch.setattr(IOHelper, "_s3_client", lambda creds: FakeClient())
+    source = tmp_path / "a.txt"
+    source.write_text("a")
+    IOHelper._upload_files({"s3_uri": "s3://bucket/datasets/1"}, {}, str(source))
+    assert uploaded == [(str(source), "bucket", "datasets/1/a.txt")]
+
+    with pytest.raises(FileNotFoundError):
+        IOHelper._upload_files({"s3_uri": "s3://bucket/datasets/1"}, {}, str(tmp_path / "missing"))